@@ -0,0 +1,197 @@
+import os
+import tempfile
+
+# Settings are read when the modules are imported, so they are set up first
+os.environ.update({
+    "HTTP_CACHE_PATH": os.path.join(tempfile.mkdtemp(prefix="tracker-benchmark-"), "http_cache.sqlite3"),
+    "OZON_CACHE_TTL": "0",
+    "WILDBERRIES_CACHE_TTL": "0",
+    "PROXY_URL": "",
+    "PROXY_URLS": "",
+    "PROXY_FILE": "",
+    "OZON_RETAINED_RUNS": "0",
+    "WILDBERRIES_RETAINED_RUNS": "0",
+})
+for _name in ("CHECKPOINT_PATH", "EXPORT_JOURNAL_PATH", "HISTORY_PATH"):
+    os.environ[_name] = os.path.join(os.path.dirname(os.environ["HTTP_CACHE_PATH"]), f"{_name.lower()}.sqlite3")
+os.environ["RUN_SUMMARY_DIR"] = os.path.join(os.path.dirname(os.environ["HTTP_CACHE_PATH"]), "runs")
+os.environ.pop("OZON_WORKBOOKS", None)
+os.environ.pop("WILDBERRIES_WORKBOOKS", None)
+
+import json  # noqa: E402
+import logging  # noqa: E402
+import platform  # noqa: E402
+import time  # noqa: E402
+import tracemalloc  # noqa: E402
+from argparse import ArgumentParser, Namespace  # noqa: E402
+from collections import Counter  # noqa: E402
+from datetime import datetime, timedelta  # noqa: E402
+from typing import Callable  # noqa: E402
+
+from google.oauth2.credentials import Credentials  # noqa: E402
+
+from benchmarks import get_version  # noqa: E402
+from benchmarks.fake_servers import FakeConfig, FakeOzon, FakeServer, FakeSheets, FakeWildberries, \
+    LocalAdapter  # noqa: E402
+from src import App  # noqa: E402
+from src.models import OZON, WILDBERRIES, ItemBatch, Marketplace  # noqa: E402
+from src.parsing import OzonParser, WildberriesParser  # noqa: E402
+from src.sheets.sheets import get_client  # noqa: E402
+from src.utils import logger, RateLimiter, get_rate_limiter, set_rate_limiter  # noqa: E402
+
+MARKETPLACES = {"ozon": OZON, "wildberries": WILDBERRIES}
+
+
+def parse_args() -> Namespace:
+    parser = ArgumentParser(description="Measures parsing and export against local fake servers")
+
+    parser.add_argument("-m", "--marketplace", choices=[*MARKETPLACES, "all"], default="all")
+    parser.add_argument("-n", "--items", help="Catalogue size", type=int, default=500)
+    parser.add_argument("--latency", help="Marketplace response time in seconds", type=float, default=0.05)
+    parser.add_argument("--sheets-latency", help="Sheets response time in seconds", type=float, default=0.1)
+    parser.add_argument("--error-rate", help="Share of marketplace requests answered with 503", type=float, default=0.0)
+    parser.add_argument("--sheets-error-rate", help="Share of Sheets requests answered with 503", type=float,
+                        default=0.0)
+    parser.add_argument("--out-of-stock-rate", type=float, default=0.1)
+    parser.add_argument("--unlimited", help="Lift the production rate limits", action="store_true")
+    parser.add_argument("--no-memory", help="Skip tracemalloc, which slows everything down", action="store_true")
+    parser.add_argument("-o", "--output", help="Write the results to a JSON file")
+    parser.add_argument("-v", "--verbose", help="Keep the app logs", action="store_true")
+
+    return parser.parse_args()
+
+
+def ozon_catalogue(size: int) -> list[list[str]]:
+    fbs = [f"https://www.ozon.ru/product/item-{100000 + i}/" for i in range(size)]
+    fbo = [f"https://www.ozon.ru/product/item-{200000 + i}/" if i % 2 == 0 else "" for i in range(size)]
+    return [["FBS", ""] + fbs, ["FBO", ""] + fbo, [], ["", ""] + ["1000"] * size, [], []]
+
+
+def wildberries_catalogue(size: int) -> list[list[str]]:
+    urls = [f"https://www.wildberries.ru/catalog/{100000 + i}/detail.aspx" for i in range(size)]
+    return [["Ссылка"] + urls, [], [""] + ["2000"] * size, [], [], []]
+
+
+def measure(phase: str, servers: dict[str, FakeServer], trace_memory: bool, run: Callable[[], int]) -> dict:
+    requests_before = {name: Counter(server.requests) for name, server in servers.items()}
+    errors_before = {name: Counter(server.errors) for name, server in servers.items()}
+
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    items = run()
+    seconds = time.perf_counter() - start
+    peak_memory = None
+    if trace_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    def diff(counters: dict[str, Counter], before: dict[str, Counter]) -> dict[str, int]:
+        return {
+            f"{name}.{endpoint}": count
+            for name in counters
+            for endpoint, count in sorted((counters[name] - before[name]).items())
+        }
+
+    return {
+        "phase": phase,
+        "items": items,
+        "seconds": round(seconds, 3),
+        "items_per_second": round(items / seconds, 2) if seconds else None,
+        "requests": diff({name: server.requests for name, server in servers.items()}, requests_before),
+        "errors": diff({name: server.errors for name, server in servers.items()}, errors_before),
+        "peak_memory_mb": round(peak_memory / 2 ** 20, 2) if peak_memory is not None else None,
+    }
+
+
+def benchmark(marketplace: Marketplace, args: Namespace, credentials: Credentials,
+              servers: dict[str, FakeServer]) -> list[dict]:
+    catalogue = ozon_catalogue(args.items) if marketplace is OZON else wildberries_catalogue(args.items)
+    servers["sheets"].add_workbook(marketplace.sheets.WORKBOOK_NAME, catalogue)
+
+    sheets = marketplace.sheets(credentials)
+    urls = sheets.get_urls()
+    items = ItemBatch()
+
+    def parse() -> int:
+        try:
+            for url, item in marketplace.parser.get_items(urls):
+                items.append(url, item)
+        finally:
+            marketplace.parser.close()
+        return len(urls)
+
+    def export() -> int:
+        # The export is the previous day's run, so the update that follows is never taken for its retry
+        sheets.set_items(items, run_at=datetime.now() - timedelta(days=1))
+        return len(items)
+
+    def update() -> int:
+        App(credentials, marketplace).update()
+        return len(urls)
+
+    return [
+        {"marketplace": marketplace.name, **measure(phase, servers, not args.no_memory, run)}
+        for phase, run in (("parse", parse), ("export", export), ("update", update))
+    ]
+
+
+def print_results(results: list[dict]) -> None:
+    print(f"{'marketplace':<12} {'phase':<7} {'items':>6} {'seconds':>8} {'items/s':>8} {'peak MB':>8}  requests")
+    for result in results:
+        requests = ", ".join(f"{endpoint}={count}" for endpoint, count in result["requests"].items())
+        print(f"{result['marketplace']:<12} {result['phase']:<7} {result['items']:>6} {result['seconds']:>8} "
+              f"{result['items_per_second'] or '-':>8} {result['peak_memory_mb'] or '-':>8}  {requests}")
+
+
+def main() -> None:
+    args = parse_args()
+    if not args.verbose:
+        logger.setLevel(logging.WARNING)
+
+    marketplace_config = FakeConfig(latency=args.latency, error_rate=args.error_rate,
+                                    out_of_stock_rate=args.out_of_stock_rate)
+    servers: dict[str, FakeServer] = {
+        "ozon": FakeOzon(marketplace_config).start(),
+        "wildberries": FakeWildberries(marketplace_config).start(),
+        "sheets": FakeSheets(FakeConfig(latency=args.sheets_latency, error_rate=args.sheets_error_rate)).start(),
+    }
+
+    OzonParser._PRODUCT_URL = servers["ozon"].url + FakeOzon.PRODUCT_PATH + "?url=%2Fproduct%2F"
+    OzonParser._ADD_TO_CART_URL = servers["ozon"].url + FakeOzon.CART_PATH
+    WildberriesParser.CARD_URL = servers["wildberries"].url + FakeWildberries.CARD_PATH
+
+    # The Ozon cart picks its limiter by host, which is the fake server now
+    set_rate_limiter("127.0.0.1", get_rate_limiter("api.ozon.ru"))
+    if args.unlimited:
+        for host in ("api.ozon.ru", "card.wb.ru", "sheets.googleapis.com", "127.0.0.1"):
+            set_rate_limiter(host, RateLimiter(host, 10 ** 6, 10 ** 6))
+
+    credentials = Credentials(token="benchmark")
+    session = get_client(credentials).session
+    adapter = LocalAdapter(servers["sheets"].url)
+    session.mount("https://sheets.googleapis.com/", adapter)
+    session.mount("https://www.googleapis.com/", adapter)
+
+    marketplaces = MARKETPLACES.values() if args.marketplace == "all" else [MARKETPLACES[args.marketplace]]
+    try:
+        results = [result for marketplace in marketplaces
+                   for result in benchmark(marketplace, args, credentials, servers)]
+    finally:
+        for server in servers.values():
+            server.stop()
+
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({
+                "version": get_version(),
+                "python": platform.python_version(),
+                "arguments": vars(args),
+                "results": results,
+            }, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
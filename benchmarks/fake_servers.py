@@ -0,0 +1,309 @@
+from __future__ import annotations
+
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from requests.adapters import HTTPAdapter
+
+
+@dataclass
+class FakeConfig:
+    latency: float = 0.05
+    jitter: float = 0.5
+    error_rate: float = 0.0
+    out_of_stock_rate: float = 0.1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: _Server
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _respond(self) -> None:
+        parsed = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+
+        status_code, response = self.server.fake.handle(self.command, parsed.path, parse_qs(parsed.query), body)
+        data = json.dumps(response, ensure_ascii=False).encode()
+
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = _respond
+    do_POST = _respond
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    fake: FakeServer
+
+
+class FakeServer:
+    def __init__(self, config: FakeConfig, seed: int = 0) -> None:
+        self.config = config
+        self.requests: Counter[str] = Counter()
+        self.errors: Counter[str] = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        self._server = _Server(("127.0.0.1", 0), _Handler)
+        self._server.fake = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self) -> FakeServer:
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def handle(self, method: str, path: str, query: dict[str, list[str]], body: bytes) -> tuple[int, dict]:
+        endpoint = self.endpoint(method, path)
+        with self._lock:
+            self.requests[endpoint] += 1
+            delay = self.config.latency * (1 + self.config.jitter * (2 * self._random.random() - 1))
+            failed = self._random.random() < self.config.error_rate
+            if failed:
+                self.errors[endpoint] += 1
+
+        time.sleep(max(delay, 0))
+        if failed:
+            return 503, {"error": "Service unavailable"}
+        return self.route(endpoint, path, query, body)
+
+    def endpoint(self, method: str, path: str) -> str:
+        return f"{method} {path}"
+
+    def route(self, endpoint: str, path: str, query: dict[str, list[str]], body: bytes) -> tuple[int, dict]:
+        raise NotImplementedError
+
+    def _out_of_stock(self, sku: int) -> bool:
+        return random.Random(sku).random() < self.config.out_of_stock_rate
+
+
+class FakeOzon(FakeServer):
+    PRODUCT_PATH = "/entrypoint-api.bx/page/json/v2"
+    CART_PATH = "/composer-api.bx/_action/addToCart"
+
+    def endpoint(self, method: str, path: str) -> str:
+        return {self.PRODUCT_PATH: "product", self.CART_PATH: "cart"}.get(path, path)
+
+    def route(self, endpoint: str, path: str, query: dict[str, list[str]], body: bytes) -> tuple[int, dict]:
+        if endpoint == "product":
+            sku = int(re.findall(r"\d+", query["url"][0])[-1])
+            if self._out_of_stock(sku):
+                return 200, {"widgetStates": {}}
+
+            price = {"price": f"{1000 + sku % 900} ₽"}
+            if sku % 2:
+                price["cardPrice"] = f"{950 + sku % 900} ₽"
+            return 200, {"widgetStates": {f"webPrice-{sku}": json.dumps(price, ensure_ascii=False)}}
+
+        if endpoint == "cart":
+            items = json.loads(body)
+            return 200, {"cart": {"cartItems": [
+                {"id": item["id"], "qty": min(item["id"] % 50 + 1, item["quantity"])}
+                for item in items if "quantity" in item
+            ]}}
+
+        return 404, {}
+
+
+class FakeWildberries(FakeServer):
+    CARD_PATH = "/cards/detail"
+
+    def endpoint(self, method: str, path: str) -> str:
+        return "card" if path == self.CARD_PATH else path
+
+    def route(self, endpoint: str, path: str, query: dict[str, list[str]], body: bytes) -> tuple[int, dict]:
+        if endpoint != "card":
+            return 404, {}
+
+        sale = int(query["spp"][0])
+        products = []
+        for nm in map(int, query["nm"][0].split(";")):
+            stocks = [] if self._out_of_stock(nm) else [{"qty": nm % 30 + 1}, {"qty": nm % 7}]
+            products.append({
+                "id": nm,
+                "salePriceU": (2000 + nm % 1000) * (100 - sale),
+                "sizes": [{"stocks": stocks}],
+            })
+        return 200, {"data": {"products": products}}
+
+
+class FakeSheets(FakeServer):
+    ROW_COUNT = 1000
+
+    def __init__(self, config: FakeConfig, seed: int = 0) -> None:
+        super().__init__(config, seed)
+        self._workbooks: dict[str, dict[int, dict]] = {}
+        self._ids: dict[str, str] = {}
+
+    def add_workbook(self, title: str, cols: list[list[str]]) -> None:
+        self._ids[title] = f"workbook{len(self._ids)}"
+        self._workbooks[self._ids[title]] = {0: {"title": "Sheet1", "cols": cols}}
+
+    def get_cols(self, title: str, sheet_id: int = 0) -> list[list[str]]:
+        return self._workbooks[self._ids[title]][sheet_id]["cols"]
+
+    def endpoint(self, method: str, path: str) -> str:
+        if path.startswith("/drive/"):
+            return "drive.files"
+        if path.endswith(":batchUpdate"):
+            return "batchUpdate"
+        if path.endswith("/values:batchGet"):
+            return "values.batchGet"
+        if "/values/" in path:
+            return "values.get"
+        return "spreadsheets.get"
+
+    def route(self, endpoint: str, path: str, query: dict[str, list[str]], body: bytes) -> tuple[int, dict]:
+        if endpoint == "drive.files":
+            title = re.search(r'name = "(.*?)"', query["q"][0]).group(1)
+            files = [{"id": self._ids[title], "name": title}] if title in self._ids else []
+            return 200, {"files": files}
+
+        workbook_id = unquote(path.split("/")[3].split(":")[0])
+        with self._lock:
+            if endpoint == "spreadsheets.get":
+                return 200, self._metadata(workbook_id)
+            if endpoint == "values.get":
+                return 200, self._values(workbook_id, unquote(path.split("/values/")[1]), query)
+            if endpoint == "values.batchGet":
+                return 200, {"spreadsheetId": workbook_id, "valueRanges": [
+                    self._values(workbook_id, range_name, query) for range_name in query["ranges"]
+                ]}
+            return 200, self._batch_update(workbook_id, json.loads(body))
+
+    def _metadata(self, workbook_id: str) -> dict:
+        return {
+            "spreadsheetId": workbook_id,
+            "properties": {"title": next(title for title, id_ in self._ids.items() if id_ == workbook_id)},
+            "sheets": [
+                {"properties": {
+                    "sheetId": sheet_id,
+                    "title": sheet["title"],
+                    "index": index,
+                    "sheetType": "GRID",
+                    "gridProperties": {"rowCount": self.ROW_COUNT, "columnCount": max(len(sheet["cols"]), 1)},
+                }}
+                for index, (sheet_id, sheet) in enumerate(self._workbooks[workbook_id].items())
+            ],
+        }
+
+    @staticmethod
+    def _col_index(letters: str) -> int:
+        index = 0
+        for letter in letters:
+            index = index * 26 + ord(letter) - ord("A") + 1
+        return index - 1
+
+    def _values(self, workbook_id: str, range_name: str, query: dict[str, list[str]]) -> dict:
+        title, _, cells = range_name.rpartition("!")
+        sheet = next(sheet for sheet in self._workbooks[workbook_id].values() if sheet["title"] == title.strip("'"))
+        cols = sheet["cols"]
+
+        first, _, last = cells.partition(":")
+        first_col, first_row = re.fullmatch(r"([A-Z]*)(\d*)", first).groups()
+        last_col, last_row = re.fullmatch(r"([A-Z]*)(\d*)", last or first).groups()
+        col_start = self._col_index(first_col) if first_col else 0
+        col_end = self._col_index(last_col) + 1 if last_col else len(cols)
+        row_start = int(first_row) - 1 if first_row else 0
+        row_end = int(last_row) if last_row else None
+
+        values = [col[row_start:row_end] for col in cols[col_start:col_end]]
+        if query.get("majorDimension", ["ROWS"])[0] != "COLUMNS":
+            rows = max(map(len, values), default=0)
+            values = [[col[i] if i < len(col) else "" for col in values] for i in range(rows)]
+
+        # Like the real API, trailing empty cells and lines are left out
+        values = [value[:len(value) - next((i for i, v in enumerate(reversed(value)) if v != ""), len(value))]
+                  for value in values]
+        while values and not values[-1]:
+            values.pop()
+        return {"range": range_name, "majorDimension": query.get("majorDimension", ["ROWS"])[0], "values": values}
+
+    def _batch_update(self, workbook_id: str, body: dict) -> dict:
+        sheets = self._workbooks[workbook_id]
+        replies = []
+        for request in body["requests"]:
+            kind, params = next(iter(request.items()))
+            reply = {}
+
+            if kind == "insertDimension" and params["range"]["dimension"] == "COLUMNS":
+                cols = sheets[params["range"]["sheetId"]]["cols"]
+                for _ in range(params["range"]["endIndex"] - params["range"]["startIndex"]):
+                    cols.insert(params["range"]["startIndex"], [])
+            elif kind == "deleteDimension" and params["range"]["dimension"] == "COLUMNS":
+                cols = sheets[params["range"]["sheetId"]]["cols"]
+                del cols[params["range"]["startIndex"]:params["range"]["endIndex"]]
+            elif kind == "updateCells" and "userEnteredValue" in params["fields"]:
+                self._update_cells(sheets[params["start"]["sheetId"]]["cols"], params)
+            elif kind == "copyPaste":
+                source, destination = params["source"], params["destination"]
+                source_cols = sheets[source["sheetId"]]["cols"]
+                target_cols = sheets[destination["sheetId"]]["cols"]
+                for offset in range(source["endColumnIndex"] - source["startColumnIndex"]):
+                    col = source["startColumnIndex"] + offset
+                    while len(target_cols) <= destination["startColumnIndex"] + offset:
+                        target_cols.append([])
+                    target_cols[destination["startColumnIndex"] + offset] = \
+                        list(source_cols[col]) if col < len(source_cols) else []
+            elif kind == "addSheet":
+                sheet_id = max(sheets) + 1
+                sheets[sheet_id] = {"title": params["properties"]["title"], "cols": []}
+                reply = {"addSheet": {"properties": {
+                    "sheetId": sheet_id,
+                    "title": params["properties"]["title"],
+                    "index": len(sheets) - 1,
+                    "sheetType": "GRID",
+                    "gridProperties": {"rowCount": self.ROW_COUNT, "columnCount": 1},
+                }}}
+
+            replies.append(reply)
+        return {"spreadsheetId": workbook_id, "replies": replies}
+
+    @staticmethod
+    def _update_cells(cols: list[list[str]], params: dict) -> None:
+        row_start, col_start = params["start"]["rowIndex"], params["start"]["columnIndex"]
+        for i, row in enumerate(params["rows"]):
+            for j, cell in enumerate(row["values"]):
+                while len(cols) <= col_start + j:
+                    cols.append([])
+                col = cols[col_start + j]
+                while len(col) <= row_start + i:
+                    col.append("")
+
+                value = cell.get("userEnteredValue", {})
+                col[row_start + i] = str(next(iter(value.values()))) if value else ""
+
+
+class LocalAdapter(HTTPAdapter):
+    # Sends requests for Google hosts to a fake server instead
+    def __init__(self, base_url: str) -> None:
+        super().__init__()
+        self._base_url = base_url
+
+    def send(self, request, **kwargs):
+        parsed = urlsplit(request.url)
+        request.url = self._base_url + parsed.path + (f"?{parsed.query}" if parsed.query else "")
+        return super().send(request, **kwargs)
@@ -0,0 +1,113 @@
+import json
+import platform
+import random
+import time
+import tracemalloc
+from argparse import ArgumentParser, Namespace
+from typing import Callable
+
+from benchmarks import get_version
+from src.parsing import OzonParser
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def parse_args() -> Namespace:
+    parser = ArgumentParser(description="Compares price extraction from Ozon page JSON payloads")
+
+    parser.add_argument("payloads", help="Captured entrypoint-api responses, a synthetic page is used without them",
+                        nargs="*")
+    parser.add_argument("-n", "--repeat", help="Extractions per payload", type=int, default=200)
+    parser.add_argument("--widgets", help="Widgets on the synthetic page", type=int, default=80)
+    parser.add_argument("-o", "--output", help="Write the results to a JSON file")
+
+    return parser.parse_args()
+
+
+def synthetic_page(widgets: int, seed: int = 0) -> str:
+    # Roughly the shape of a product page, where the price is one of many JSON encoded widget states
+    rng = random.Random(seed)
+    states = {}
+    for i in range(widgets):
+        if i == widgets // 2:
+            states["webPrice-3121879-default-1"] = json.dumps(
+                {"isAvailable": True, "price": "1 290 ₽", "cardPrice": "1 190 ₽", "originalPrice": "2 500 ₽"},
+                ensure_ascii=False,
+            )
+        state = {
+            "items": [{"title": f"Товар {rng.random()}", "link": f"/product/item-{rng.randint(1, 10 ** 8)}/",
+                       "webPrice": f"{rng.randint(100, 9999)} ₽"} for _ in range(20)],
+            "trackingInfo": {"key": "".join(rng.choices("abcdef0123456789", k=256))},
+        }
+        states[f"widget{i}-{rng.randint(1, 10 ** 6)}-default-1"] = json.dumps(state, ensure_ascii=False)
+
+    return json.dumps({
+        "layout": [{"component": key.split("-")[0], "stateId": key} for key in states],
+        "widgetStates": states,
+        "pageInfo": {"url": "/product/item-3121879/", "layoutId": 1},
+    }, ensure_ascii=False)
+
+
+def measure(text: str, repeat: int, extract: Callable[[str], tuple[int, int | None]]) -> dict:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        extract(text)
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    extract(text)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "microseconds": round(seconds / repeat * 10 ** 6, 1),
+        "peak_memory_kb": round(peak_memory / 2 ** 10, 1),
+    }
+
+
+def main() -> None:
+    args = parse_args()
+
+    payloads = {}
+    for path in args.payloads:
+        with open(path, encoding="utf-8") as file:
+            payloads[path] = file.read()
+    if not payloads:
+        payloads["synthetic"] = synthetic_page(args.widgets)
+
+    methods = {
+        "json": lambda text: OzonParser._get_prices(json.loads(text)),
+        "targeted": OzonParser._extract_prices,
+    }
+    if orjson is not None:
+        methods["orjson"] = lambda text: OzonParser._get_prices(orjson.loads(text))
+
+    results = []
+    for name, text in payloads.items():
+        expected = methods["json"](text)
+        for method, extract in methods.items():
+            if extract(text) != expected:
+                raise ValueError(f"{method} extracted {extract(text)} instead of {expected} from {name}")
+            results.append({"payload": name, "size_kb": round(len(text.encode()) / 2 ** 10, 1), "method": method,
+                            **measure(text, args.repeat, extract)})
+
+    print(f"{'payload':<24} {'KB':>8} {'method':<9} {'µs':>10} {'peak KB':>10}")
+    for result in results:
+        print(f"{result['payload'][-24:]:<24} {result['size_kb']:>8} {result['method']:<9} "
+              f"{result['microseconds']:>10} {result['peak_memory_kb']:>10}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({
+                "version": get_version(),
+                "python": platform.python_version(),
+                "arguments": vars(args),
+                "results": results,
+            }, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+import asyncio
+import multiprocessing
 import os
 from argparse import ArgumentParser, Namespace
 import sys
@@ -6,9 +8,13 @@ from time import sleep
 import schedule
 
 from src import App
-from src.config import CREDENTIAL
-from src.models import OZON, WILDBERRIES
-from src.utils import logger
+from src.config import get_credentials
+from src.models import OZON, WILDBERRIES, Marketplace, get_marketplace, get_marketplaces
+from src.polling import PollingPolicy
+from src.scheduler import Scheduler
+from src.storage import WorkQueue
+from src.worker import Worker
+from src.utils import logger, start_metrics_server
 from src.utils.logger import initialize_file_logger
 
 
@@ -19,6 +25,21 @@ def parse_args() -> Namespace:
     parser.add_argument(
         "-wb", "--wildberries", help="Parse Wildberries", action="store_true"
     )
+    parser.add_argument(
+        "-m", "--marketplace", help="Parse a marketplace by name, including ones added by plugins", type=str
+    )
+    parser.add_argument(
+        "-a", "--all", help="Parse every marketplace in one process", action="store_true"
+    )
+    parser.add_argument(
+        "--coordinator", help="Queue the items for worker processes instead of parsing them", action="store_true"
+    )
+    parser.add_argument(
+        "--worker", help="Parse the items queued by a coordinator", action="store_true"
+    )
+    parser.add_argument(
+        "-w", "--workers", help="Worker processes to start along with the coordinator", type=int, default=0
+    )
     parser.add_argument(
         "-u",
         "--update-immediately",
@@ -36,22 +57,63 @@ def parse_args() -> Namespace:
     return parser.parse_args()
 
 
+def run_all(args: Namespace) -> None:
+    initialize_file_logger("All")
+    scheduler = Scheduler()
+
+    for marketplace in get_marketplaces():
+        start_time = os.getenv(f"{marketplace.name.upper()}_START_TIME", args.start_time)
+
+        def setup(marketplace: Marketplace = marketplace):
+            app = App(get_credentials(), marketplace, WorkQueue(marketplace.name) if args.coordinator else None)
+            return app.update, app.poll if PollingPolicy.enabled() else None
+
+        scheduler.every_day_at(start_time, marketplace.name, setup, PollingPolicy.CHECK_INTERVAL)
+
+    asyncio.run(scheduler.run(args.update_immediately))
+
+
+def run_worker(name: str) -> None:
+    worker = Worker(get_marketplace(name))
+    # Each worker rotates its own file, containers share the log directory and may have the same pid
+    initialize_file_logger(f"{worker.marketplace.name}Worker-{worker.name}")
+    worker.run()
+
+
 def main() -> None:
     args = parse_args()
+    start_metrics_server()
+
+    if args.all:
+        run_all(args)
+        return
 
-    if args.ozon:
+    if args.marketplace:
+        marketplace = get_marketplace(args.marketplace)
+    elif args.ozon:
         marketplace = OZON
     elif args.wildberries:
         marketplace = WILDBERRIES
     else:
         logger.warning("No marketplace specified. Use -h for help")
         return
+    if args.worker:
+        run_worker(marketplace.name)
+        return
     initialize_file_logger(marketplace.name)
 
-    app = App(CREDENTIAL, marketplace)
+    # Workers started here are spawned, so that they do not inherit the coordinator's threads
+    context = multiprocessing.get_context("spawn")
+    for _ in range(args.workers):
+        context.Process(target=run_worker, args=(marketplace.name,), daemon=True).start()
+
+    queue = WorkQueue(marketplace.name) if args.coordinator or args.workers else None
+    app = App(get_credentials(), marketplace, queue)
     logger.debug("App initialized")
 
     schedule.every().day.at(args.start_time).do(app.update)
+    if PollingPolicy.enabled():
+        schedule.every(PollingPolicy.CHECK_INTERVAL).seconds.do(app.poll)
 
     if args.update_immediately:
         app.update()
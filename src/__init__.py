@@ -1 +1,6 @@
-from .app import App
+def __getattr__(name: str):
+    # App brings in every client, so importing the models or the parsers alone does not load it
+    if name == "App":
+        from .app import App
+        return App
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,44 +1,365 @@
-from time import sleep
+from __future__ import annotations
 
-from oauth2client.service_account import ServiceAccountCredentials
+import json
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from dataclasses import asdict
+from datetime import datetime, timedelta
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from time import perf_counter, sleep
+from typing import TYPE_CHECKING, Callable, Hashable, Iterator, TypeVar
 
-from src.models import Item, Marketplace
+from src.models import ItemBatch, Marketplace, Urls, Violation
+from src.parsing.item_parser import ItemResult
+from src.polling import PollingPolicy
+from src.storage import Checkpoint, HistoryStore, WorkQueue
 from src.utils import logger
+from src.utils.metrics import ITEMS, REGISTRY, RUNS, STAGE_SECONDS, VIOLATIONS
+
+if TYPE_CHECKING:
+    from oauth2client.service_account import ServiceAccountCredentials
+
+    from src.sheets import Sheets
+
+_DONE = object()
+
+T = TypeVar("T")
+R = TypeVar("R")
 
 
 class App:
+    PARSE_BACKOFF = 5
+    MAX_PARSE_BACKOFF = 5 * 60
+    QUEUE_SIZE = 500
+    EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 200))
+    EXPORT_INTERVAL = 30
+    SHEETS_WORKERS = int(os.getenv("SHEETS_WORKERS", 4))
+    RUN_SUMMARY_DIR = os.getenv("RUN_SUMMARY_DIR", "data/runs")
+    SHARD_SIZE = int(os.getenv("SHARD_SIZE", 100))
+    SHARD_POLL_DELAY = 1
+
     def __init__(
         self,
         credentials: ServiceAccountCredentials,
         marketplace: Marketplace,
+        queue: WorkQueue | None = None,
     ) -> None:
         self.marketplace = marketplace
-        self.sheets = self.marketplace.sheets(credentials)
+        self.queue = queue
+        self._pool = ThreadPoolExecutor(self.SHEETS_WORKERS, thread_name_prefix=f"{marketplace.name}Sheets")
+        self.sheets: list[Sheets] = self._map(
+            lambda target: self.marketplace.sheets(credentials, *target),
+            self.marketplace.sheets.get_targets(),
+        )
+        self.history = HistoryStore()
+        self.checkpoint = Checkpoint(self.marketplace.name)
+        self.polling = PollingPolicy(self.history, self.marketplace.name)
+        self.marketplace.parser.set_max_cache_age(self.polling.get_max_cache_age())
+        self._urls: Urls | None = None
+        self._carried: set = set()
+
+    def _stage(self, stage: str):
+        return STAGE_SECONDS.time(marketplace=self.marketplace.name, stage=stage)
+
+    def _map(self, func: Callable[[T], R], values: list[T]) -> list[R]:
+        return list(self._pool.map(func, values))
 
     def update(self):
+        started_at, start, metrics_before = datetime.now(), perf_counter(), REGISTRY.snapshot()
+        # The sheets may have been edited since they were opened or last written to
+        self._map(lambda sheets: sheets.invalidate_snapshot(), self.sheets)
+        run_ats = {sheets: self._get_run_at(sheets) for sheets in self.sheets}
         logger.info("Getting items...")
 
-        while True:
-            try:
-                items = self._get_items()
-                logger.debug("\n".join(map(str, items)))
-                break
-            except Exception as e:
-                logger.exception(e)
+        try:
+            attempt = 0
+            while True:
+                try:
+                    items = self._update(run_ats)
+                    logger.debug("\n".join(map(str, items.values())))
+                    break
+                except Exception as e:
+                    logger.exception(e)
+                    sleep(min(self.PARSE_BACKOFF * 2 ** attempt, self.MAX_PARSE_BACKOFF))
+                    attempt += 1
+        finally:
+            self.marketplace.parser.close()
 
-        logger.info("Exporting...")
+        try:
+            # Carried over items were not fetched, so they are not new observations
+            self.history.add_items(self.marketplace.name,
+                                   items.select(url for url in items if url not in self._carried).values())
+        except Exception as e:
+            logger.exception(e)
 
-        while True:
-            try:
-                self.sheets.set_items(items)
-                break
-            except Exception as e:
-                logger.exception(e)
-                sleep(60)
+        self.checkpoint.clear()
+        if self.queue is not None:
+            self.queue.clear()
+
+        violations = self.get_violations()
+        if violations:
+            logger.warning(f"{len(violations)} values are below their restrictions")
+        for violation in violations:
+            logger.debug(f"{violation.sheet} {violation.cell}: {violation.value} is below {violation.restriction} "
+                         f"({violation.url})")
+            VIOLATIONS.inc(sheet=violation.sheet)
+
+        statuses = items.count_statuses()
+        for status, count in statuses.items():
+            ITEMS.inc(count, marketplace=self.marketplace.name, status=status)
+        RUNS.inc(marketplace=self.marketplace.name)
+        STAGE_SECONDS.observe(perf_counter() - start, marketplace=self.marketplace.name, stage="update")
+
+        try:
+            self._write_summary(started_at, perf_counter() - start, attempt + 1, statuses, violations,
+                                metrics_before)
+        except Exception as e:
+            logger.exception(e)
 
         logger.info("Done exporting!")
 
-    def _get_items(self) -> list[Item]:
-        urls = self.sheets.get_urls()
+    def poll(self) -> None:
+        # Between updates the items that are due are fetched into the history only
+        if not self.polling.enabled():
+            return
+
+        try:
+            if self._urls is None:
+                self._urls, _ = self._get_urls()
+                self._map(lambda sheets: sheets.invalidate_snapshot(), self.sheets)
+
+            urls, _ = self.polling.plan(list(self._urls), complete=False)
+            if not urls:
+                return
+
+            logger.info(f"Polling {len(urls)} of {len(self._urls)} items...")
+            with self._stage("poll"), closing(self._parse_items(type(self._urls)(urls))) as results:
+                items = ItemBatch.from_results(result for result in results if result is not None)
+            self.history.add_items(self.marketplace.name, items.values())
+        except Exception as e:
+            logger.exception(e)
+            return
+        finally:
+            self.marketplace.parser.close()
+
+        for status, count in items.count_statuses().items():
+            ITEMS.inc(count, marketplace=self.marketplace.name, status=status)
+
+    def get_violations(self) -> list[Violation]:
+        return [violation for sheets in self.sheets for violation in sheets.violations]
+
+    def _write_summary(self, started_at: datetime, seconds: float, attempts: int, statuses: Counter[str],
+                       violations: list[Violation], metrics_before: dict[str, dict]) -> None:
+        # Counters are process wide, so the run's share is the difference from the snapshot taken at its start
+        metrics = REGISTRY.snapshot()
+
+        def diff(name: str) -> dict[str, float]:
+            return {
+                ",".join(f"{label}={value}" for label, value in key): count - metrics_before[name].get(key, 0)
+                for key, count in sorted(metrics[name].items())
+                if count != metrics_before[name].get(key, 0)
+            }
+
+        stages = {
+            dict(key)["stage"]: round(total - metrics_before["tracker_stage_seconds"].get(key, (0, 0))[1], 3)
+            for key, (_, total) in metrics["tracker_stage_seconds"].items()
+            if dict(key)["marketplace"] == self.marketplace.name
+        }
+
+        if not os.path.exists(self.RUN_SUMMARY_DIR):
+            os.makedirs(self.RUN_SUMMARY_DIR)
+        path = os.path.join(self.RUN_SUMMARY_DIR,
+                            f"{self.marketplace.name}-{started_at.strftime('%Y-%m-%d_%H-%M-%S')}.json")
+        with open(path, "w") as file:
+            json.dump({
+                "marketplace": self.marketplace.name,
+                "started_at": started_at.isoformat(timespec="seconds"),
+                "finished_at": datetime.now().isoformat(timespec="seconds"),
+                "seconds": round(seconds, 3),
+                "attempts": attempts,
+                "items": sum(statuses.values()),
+                "carried": len(self._carried),
+                "statuses": dict(statuses),
+                "stages": stages,
+                "requests": diff("tracker_requests_total"),
+                "retries": diff("tracker_retries_total"),
+                "violations": list(map(asdict, violations)),
+            }, file, indent=2)
+        logger.info(f"Run summary written to {path}")
+
+    @staticmethod
+    def _get_run_at(sheets: Sheets) -> datetime:
+        # A run that was cut off keeps its columns, so it is finished instead of starting a new one
+        run_at = sheets.get_unfinished_run()
+        if run_at is not None and datetime.now() - run_at < timedelta(seconds=Checkpoint.WINDOW):
+            logger.info(f"Resuming {sheets.name} run from {run_at}")
+            return run_at
+        return datetime.now()
+
+    def _get_urls(self) -> tuple[Urls, dict[Sheets, set]]:
+        with self._stage("read"):
+            sheets_urls = dict(zip(self.sheets, self._map(lambda sheets: sheets.get_urls(), self.sheets)))
+
+        # Products shared between sheets are parsed once and written to each of them
+        urls = next(iter(sheets_urls.values()))
+        urls = type(urls)(list(dict.fromkeys(url for sheet_urls in sheets_urls.values() for url in sheet_urls)))
         logger.debug(f"Got urls: {urls}")
-        return self.marketplace.parser.get_items(urls)
+        return urls, {sheets: set(sheet_urls) for sheets, sheet_urls in sheets_urls.items()}
+
+    def _update(self, run_ats: dict[Sheets, datetime]) -> ItemBatch:
+        urls, sheets_urls = self._get_urls()
+        self._urls = urls
+        with self._stage("begin"):
+            self._map(lambda sheets: sheets.begin_export(run_ats[sheets]), self.sheets)
+
+        results = self.checkpoint.load()
+        remaining = [url for url in urls if url not in results]
+        if len(remaining) < len(urls):
+            logger.info(f"Restored {len(urls) - len(remaining)} items from checkpoint")
+
+        # Items that are not due keep their last known values and are not saved to the checkpoint,
+        # so that a resumed run plans them again
+        remaining, carried = self.polling.plan(remaining)
+        self._carried = set(carried)
+        if carried:
+            logger.info(f"Carried {len(carried)} items over from history")
+            for url, item in carried.items():
+                results.append(url, item)
+
+        exported = {sheets: self.checkpoint.get_exported(sheets.name, run_ats[sheets]) for sheets in self.sheets}
+        self._export(run_ats, self._split(sheets_urls, results, exported))
+
+        pending = ItemBatch()
+        with closing(self._parse_items(type(urls)(remaining))) as stream:
+            for result in stream:
+                if result is not None:
+                    url, item = result
+                    results.append(url, item)
+                    self.checkpoint.save(url, item)
+                    pending.append(url, item)
+
+                if len(pending) >= self.EXPORT_CHUNK_SIZE or result is None and pending:
+                    self._export(run_ats, self._split(sheets_urls, pending))
+                    pending = ItemBatch()
+
+        self._export(run_ats, self._split(sheets_urls, pending))
+        with self._stage("finish"):
+            self._map(lambda sheets: sheets.finish_export(run_ats[sheets]), self.sheets)
+
+        return results.select(urls)
+
+    @staticmethod
+    def _split(sheets_urls: dict[Sheets, set], items: ItemBatch,
+               exported: dict[Sheets, set] | None = None) -> dict[Sheets, ItemBatch]:
+        return {
+            sheets: items.select(
+                url for url in items
+                if url in urls and (exported is None or url not in exported[sheets])
+            )
+            for sheets, urls in sheets_urls.items()
+        }
+
+    def _export(self, run_ats: dict[Sheets, datetime], sheets_items: dict[Sheets, ItemBatch]) -> None:
+        sheets_items = {sheets: items for sheets, items in sheets_items.items() if items}
+        if not sheets_items:
+            return
+
+        for sheets, items in sheets_items.items():
+            logger.info(f"Exporting {len(items)} items to {sheets.name}...")
+        with self._stage("write"):
+            self._map(lambda sheets: sheets.write_items(sheets_items[sheets]), list(sheets_items))
+
+        for sheets, items in sheets_items.items():
+            self.checkpoint.mark_exported(sheets.name, items, run_ats[sheets])
+
+    def _parse_items(self, urls: Urls) -> Iterator[ItemResult | None]:
+        # Urls of one product, under another slug or query string, are parsed once and the result goes to each
+        products: dict[Hashable, list] = {}
+        for url in urls:
+            products.setdefault(self.marketplace.parser.get_product_key(url), []).append(url)
+        aliases = {same_urls[0]: same_urls for same_urls in products.values()}
+
+        with closing(self._stream_items(type(urls)(list(aliases)))) as stream:
+            for result in stream:
+                if result is None:
+                    yield None
+                    continue
+
+                url, item = result
+                for alias in aliases.get(url, [url]):
+                    yield alias, item
+
+    def _stream_items(self, urls: Urls) -> Iterator[ItemResult | None]:
+        # Parsing runs in its own thread and the bounded queue holds it back while the export catches up.
+        # None is yielded when nothing arrived for a while, so that pending items are not held for long.
+        if self.queue is not None:
+            yield from self._stream_shards(urls)
+            return
+
+        results = Queue(maxsize=self.QUEUE_SIZE)
+        stop = Event()
+
+        def put(value) -> None:
+            while not stop.is_set():
+                try:
+                    results.put(value, timeout=1)
+                    return
+                except Full:
+                    pass
+
+        def produce() -> None:
+            try:
+                with self._stage("parse"), closing(self.marketplace.parser.get_items(urls)) as items:
+                    for result in items:
+                        if stop.is_set():
+                            return
+                        put(result)
+            except Exception as e:
+                put(e)
+            else:
+                put(_DONE)
+
+        producer = Thread(target=produce, daemon=True)
+        producer.start()
+        try:
+            while True:
+                try:
+                    result = results.get(timeout=self.EXPORT_INTERVAL)
+                except Empty:
+                    yield None
+                    continue
+
+                if result is _DONE:
+                    return
+                if isinstance(result, Exception):
+                    raise result
+                yield result
+        finally:
+            stop.set()
+            producer.join()
+
+    def _stream_shards(self, urls: Urls) -> Iterator[ItemResult | None]:
+        # Workers parse the shards in their own processes and the results are taken as the shards complete
+        run = self.queue.put(list(urls), self.SHARD_SIZE)
+        logger.info(f"Queued {len(urls)} items for the workers")
+
+        with self._stage("parse"):
+            idle_since = perf_counter()
+            while True:
+                results, remaining, failed = self.queue.take(run)
+                yield from results
+                if not remaining:
+                    return
+                # As with a parser that fails locally, the update retries and queues the items again
+                if failed:
+                    raise RuntimeError(f"Shards {failed} failed on {WorkQueue.MAX_ATTEMPTS} attempts")
+
+                if results:
+                    idle_since = perf_counter()
+                elif perf_counter() - idle_since >= self.EXPORT_INTERVAL:
+                    yield None
+                    idle_since = perf_counter()
+                sleep(self.SHARD_POLL_DELAY)
@@ -1,4 +1,11 @@
-from oauth2client.service_account import ServiceAccountCredentials
+from __future__ import annotations
+
+import os
+from functools import cache
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from oauth2client.service_account import ServiceAccountCredentials
 
 SCOPE = (
     "https://spreadsheets.google.com/feeds",
@@ -7,4 +14,12 @@ SCOPE = (
     "https://www.googleapis.com/auth/drive"
 )
 
-CREDENTIAL = ServiceAccountCredentials.from_json_keyfile_name("creds.json", SCOPE)
+CREDENTIALS_PATH = os.getenv("CREDENTIALS_PATH", "creds.json")
+
+
+@cache
+def get_credentials() -> ServiceAccountCredentials:
+    # Read on first use, so that the modules can be imported without creds.json or the Google client
+    from oauth2client.service_account import ServiceAccountCredentials
+
+    return ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_PATH, SCOPE)
@@ -1,4 +1,5 @@
-from .item import Item, OzonItem, OzonItemPair, WildberriesItem
+from .item import Item, ItemBatch, OzonItem, OzonItemPair, WildberriesItem
 from .status import Status
 from .urls import Urls, OzonUrls, WildberriesUrls
-from .marketplace import Marketplace, OZON, WILDBERRIES
+from .violation import Violation
+from .marketplace import Marketplace, OZON, WILDBERRIES, MARKETPLACES, get_marketplace, get_marketplaces
@@ -1,3 +1,4 @@
 from .item import Item
 from .ozon_item import OzonItem, OzonItemPair
 from .wildberries_item import WildberriesItem
+from .item_batch import ItemBatch
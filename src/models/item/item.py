@@ -2,4 +2,4 @@ from abc import ABC
 
 
 class Item(ABC):
-    pass
+    __slots__ = ()
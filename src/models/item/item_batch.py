@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import sys
+from array import array
+from collections import Counter
+from typing import Iterable, Iterator
+
+from src.models.item.item import Item
+from src.models.item.ozon_item import OzonItem, OzonItemPair
+from src.models.item.wildberries_item import WildberriesItem
+from src.models.status import Status
+
+Key = str | tuple[str, str]
+
+_STATUSES = list(Status)
+_STATUS_CODES = {status: code for code, status in enumerate(_STATUSES)}
+_MISSING = -1
+
+
+class ItemBatch:
+    # Items are held as array columns instead of objects, with an entry per side of a result:
+    # FBS and FBO for an Ozon url pair, a single one for a Wildberries url. Urls are interned keys.
+    __slots__ = ("keys", "statuses", "quantities", "prices", "green_prices", "no_sale_prices", "_positions", "_sides")
+
+    def __init__(self) -> None:
+        self.keys: list[Key] = []
+        self.statuses = array("b")
+        self.quantities = array("i")
+        self.prices = array("i")
+        self.green_prices = array("i")
+        self.no_sale_prices = array("i")
+        self._positions: dict[Key, int] = {}
+        self._sides = 1
+
+    @classmethod
+    def from_results(cls, results: Iterable[tuple[Key, Item | None]]) -> ItemBatch:
+        batch = cls()
+        for key, item in results:
+            batch.append(key, item)
+        return batch
+
+    @classmethod
+    def from_items(cls, items: Iterable[Item]) -> ItemBatch:
+        # Without the urls they were parsed for, items are keyed by their own urls
+        batch = cls()
+        for item in items:
+            if isinstance(item, OzonItemPair):
+                batch.append((item.fbs.url or "" if item.fbs else "", item.fbo.url or "" if item.fbo else ""), item)
+            else:
+                batch.append(item.url, item)
+        return batch
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key: Key) -> bool:
+        return key in self._positions
+
+    def __iter__(self) -> Iterator[Key]:
+        return iter(self.keys)
+
+    def position(self, key: Key) -> int | None:
+        return self._positions.get(key)
+
+    def index(self, position: int, side: int = 0) -> int:
+        return position * self._sides + side
+
+    def status(self, index: int) -> Status | None:
+        code = self.statuses[index]
+        return _STATUSES[code] if code != _MISSING else None
+
+    def append(self, key: Key, item: Item | None) -> None:
+        if not self.keys:
+            self._sides = 2 if isinstance(key, tuple) else 1
+
+        item_sides = (None,) * self._sides
+        if isinstance(item, OzonItemPair):
+            item_sides = (item.fbs, item.fbo)
+        elif item is not None:
+            item_sides = (item,)
+
+        position = self._positions.get(key)
+        if position is None:
+            key = tuple(map(sys.intern, key)) if isinstance(key, tuple) else sys.intern(key)
+            position = len(self.keys)
+            self._positions[key] = position
+            self.keys.append(key)
+            for column in (self.statuses, self.quantities, self.prices, self.green_prices, self.no_sale_prices):
+                column.extend([0] * self._sides)
+
+        for side, value in enumerate(item_sides):
+            index = self.index(position, side)
+            if value is None:
+                self.statuses[index] = _MISSING
+                continue
+
+            self.statuses[index] = _STATUS_CODES[value.status]
+            self.quantities[index] = value.quantity
+            if isinstance(value, WildberriesItem):
+                self.prices[index] = value.sale_price
+                self.no_sale_prices[index] = value.no_sale_price
+            else:
+                self.prices[index] = value.price
+                self.green_prices[index] = value.green_price or 0
+
+    def get(self, key: Key, default: Item | None = None) -> Item | None:
+        position = self._positions.get(key)
+        if position is None:
+            return default
+        return self._get_item(position)
+
+    def _get_item(self, position: int) -> Item | None:
+        key = self.keys[position]
+        if self._sides == 1:
+            index = self.index(position)
+            if self.statuses[index] == _MISSING:
+                return None
+            return WildberriesItem(url=key, quantity=self.quantities[index], sale_price=self.prices[index],
+                                   no_sale_price=self.no_sale_prices[index], status=self.status(index))
+
+        fbs, fbo = (self._get_ozon_item(url, self.index(position, side)) for side, url in enumerate(key))
+        return OzonItemPair(fbs=fbs, fbo=fbo) if fbs or fbo else None
+
+    def _get_ozon_item(self, url: str, index: int) -> OzonItem | None:
+        if self.statuses[index] == _MISSING:
+            return None
+        return OzonItem(url=url, quantity=self.quantities[index], price=self.prices[index],
+                        status=self.status(index), green_price=self.green_prices[index] or None)
+
+    def items(self) -> Iterator[tuple[Key, Item | None]]:
+        for position, key in enumerate(self.keys):
+            yield key, self._get_item(position)
+
+    def values(self) -> Iterator[Item]:
+        # Items are built one at a time, so that consumers do not hold the whole run as objects
+        for _, item in self.items():
+            if item is not None:
+                yield item
+
+    def select(self, keys: Iterable[Key]) -> ItemBatch:
+        batch = ItemBatch()
+        batch._sides = self._sides
+        columns = ("statuses", "quantities", "prices", "green_prices", "no_sale_prices")
+        for key in keys:
+            position = self._positions.get(key)
+            if position is None or key in batch._positions:
+                continue
+
+            batch._positions[key] = len(batch.keys)
+            batch.keys.append(self.keys[position])
+            start = self.index(position)
+            for column in columns:
+                getattr(batch, column).extend(getattr(self, column)[start:start + self._sides])
+        return batch
+
+    def count_statuses(self) -> Counter[str]:
+        return Counter({_STATUSES[code].name: count for code, count in Counter(self.statuses).items()
+                        if code != _MISSING})
@@ -4,7 +4,7 @@ from src.models.item.item import Item
 from src.models.status import Status
 
 
-@dataclass
+@dataclass(slots=True)
 class OzonItem:
     url: str | None = None
     quantity: int = 0
@@ -13,7 +13,7 @@ class OzonItem:
     green_price: int | None = None
 
 
-@dataclass
+@dataclass(slots=True)
 class OzonItemPair(Item):
     fbs: OzonItem | None
     fbo: OzonItem | None
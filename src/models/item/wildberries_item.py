@@ -4,7 +4,7 @@ from src.models.item.item import Item
 from src.models.status import Status
 
 
-@dataclass
+@dataclass(slots=True)
 class WildberriesItem(Item):
     url: str | None = None
     quantity: int = 0
@@ -12,6 +12,10 @@ class WildberriesItem(Item):
     no_sale_price: int = 0
     status: Status = Status.DEFAULT
 
+    @staticmethod
+    def get_sale_formula(sale_price: int, no_sale_price: int) -> str:
+        return f"=({no_sale_price} - {sale_price}) / {no_sale_price}"
+
     @property
     def sale_formula(self) -> str:
-        return f"=({self.no_sale_price} - {self.sale_price}) / {self.no_sale_price}"
+        return self.get_sale_formula(self.sale_price, self.no_sale_price)
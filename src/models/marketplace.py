@@ -1,24 +1,71 @@
+from __future__ import annotations
+
 from dataclasses import dataclass
+from functools import cached_property
+from importlib import import_module
+from importlib.metadata import entry_points
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from src.parsing import ItemParser
+    from src.sheets import Sheets
+
+ENTRY_POINT_GROUP = "marketplaces_goods_tracker.marketplaces"
+
 
-from src.parsing import ItemParser, OzonParser, WildberriesParser
-from src.sheets import Sheets, OzonSheets, WildberriesSheets
+def _load(path: str):
+    module_name, _, attribute = path.partition(":")
+    return getattr(import_module(module_name), attribute)
 
 
 @dataclass
 class Marketplace:
-    parser: type[ItemParser]
-    sheets: type[Sheets]
-    name: str = None
+    # Parser and sheets are given as "module:attribute" and only imported on first use,
+    # so a process that works with one marketplace does not load the others' dependencies
+    name: str
+    parser_path: str
+    sheets_path: str
+
+    @cached_property
+    def parser(self) -> type[ItemParser]:
+        return _load(self.parser_path)
+
+    @cached_property
+    def sheets(self) -> type[Sheets]:
+        return _load(self.sheets_path)
 
 
 OZON = Marketplace(
-    parser=OzonParser,
-    sheets=OzonSheets,
-    name="Ozon"
+    name="Ozon",
+    parser_path="src.parsing.ozon_parser:OzonParser",
+    sheets_path="src.sheets.ozon_sheets:OzonSheets",
 )
 
 WILDBERRIES = Marketplace(
-    parser=WildberriesParser,
-    sheets=WildberriesSheets,
-    name="Wildberries"
+    name="Wildberries",
+    parser_path="src.parsing.wildberries_parser:WildberriesParser",
+    sheets_path="src.sheets.wildberries_sheets:WildberriesSheets",
 )
+
+MARKETPLACES = [OZON, WILDBERRIES]
+
+
+def get_marketplaces() -> list[Marketplace]:
+    # Installed packages may add marketplaces through entry points that point at a Marketplace
+    marketplaces = {marketplace.name.lower(): marketplace for marketplace in MARKETPLACES}
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        if entry_point.name.lower() not in marketplaces:
+            marketplaces[entry_point.name.lower()] = entry_point.load()
+    return list(marketplaces.values())
+
+
+def get_marketplace(name: str) -> Marketplace:
+    for marketplace in MARKETPLACES:
+        if marketplace.name.lower() == name.lower():
+            return marketplace
+
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        if entry_point.name.lower() == name.lower():
+            return entry_point.load()
+
+    raise KeyError(f"Unknown marketplace: {name}")
@@ -0,0 +1,12 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+
+@dataclass(slots=True)
+class Violation:
+    sheet: str
+    url: str | tuple[str, str] | None
+    cell: str
+    value: int
+    restriction: int
@@ -1,6 +1,18 @@
+from importlib import import_module
+
 from .item_parser import ItemParser
-from .ozon_parser import OzonParser
-from .wildberries_parser import WildberriesParser
+
+_PARSERS = {
+    "OzonParser": ".ozon_parser",
+    "WildberriesParser": ".wildberries_parser",
+}
+
+
+def __getattr__(name: str):
+    # Each parser brings in its own HTTP client, so it is imported when first asked for
+    if name in _PARSERS:
+        return getattr(import_module(_PARSERS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 __all__ = [
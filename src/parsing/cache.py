@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import os
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from src.storage.sqlite_store import SqliteStore
+from src.utils import logger
+
+
+@dataclass
+class CachedResponse:
+    status_code: int
+    url: str
+    text: str
+
+    def json(self):
+        return json.loads(self.text)
+
+    @staticmethod
+    def from_response(response) -> CachedResponse:
+        return CachedResponse(status_code=response.status_code, url=str(response.url), text=response.text)
+
+
+class ResponseCache(SqliteStore):
+    PATH = os.getenv("HTTP_CACHE_PATH", "data/http_cache.sqlite3")
+    MAX_ENTRIES = int(os.getenv("HTTP_CACHE_SIZE", 10000))
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS responses (
+            endpoint TEXT NOT NULL,
+            key TEXT NOT NULL,
+            status_code INTEGER NOT NULL,
+            url TEXT NOT NULL,
+            text TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            accessed_at REAL NOT NULL,
+            PRIMARY KEY (endpoint, key)
+        );
+        CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+    """
+
+    def __init__(self, ttls: dict[str, float], path: str | None = None, max_entries: int | None = None,
+                 max_age: float = math.inf) -> None:
+        super().__init__(path)
+        self._ttls = {endpoint: min(ttl, max_age) for endpoint, ttl in ttls.items()}
+        self._max_entries = max_entries or self.MAX_ENTRIES
+        self._in_flight: dict[tuple[str, str], asyncio.Future] = {}
+
+        self.hits: Counter[str] = Counter()
+        self.misses: Counter[str] = Counter()
+
+    def close(self) -> None:
+        for endpoint in sorted(set(self.hits) | set(self.misses)):
+            logger.info(f"Cache {endpoint}: {self.hits[endpoint]} hits, {self.misses[endpoint]} misses")
+
+        super().close()
+
+    def get(self, endpoint: str, key: str) -> CachedResponse | None:
+        return self.get_many(endpoint, [key]).get(key)
+
+    def get_many(self, endpoint: str, keys: list[str]) -> dict[str, CachedResponse]:
+        now = time.time()
+        rows = {}
+        with self._transaction() as connection:
+            for key in keys:
+                row = connection.execute(
+                    "SELECT status_code, url, text FROM responses WHERE endpoint = ? AND key = ? AND created_at > ?",
+                    (endpoint, key, now - self._ttls.get(endpoint, 0)),
+                ).fetchone()
+                if row is not None:
+                    rows[key] = row
+            connection.executemany(
+                "UPDATE responses SET accessed_at = ? WHERE endpoint = ? AND key = ?",
+                [(now, endpoint, key) for key in rows],
+            )
+
+        self.hits[endpoint] += len(rows)
+        self.misses[endpoint] += len(keys) - len(rows)
+        return {key: CachedResponse(*row) for key, row in rows.items()}
+
+    def set(self, endpoint: str, key: str, response: CachedResponse) -> None:
+        self.set_many(endpoint, {key: response})
+
+    def set_many(self, endpoint: str, responses: dict[str, CachedResponse]) -> None:
+        responses = {key: response for key, response in responses.items() if response.status_code == 200}
+        if not responses or not self._ttls.get(endpoint):
+            return
+
+        now = time.time()
+        with self._transaction() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(endpoint, key, response.status_code, response.url, response.text, now, now)
+                 for key, response in responses.items()],
+            )
+            connection.execute(
+                "DELETE FROM responses WHERE rowid IN "
+                "(SELECT rowid FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self._max_entries,),
+            )
+
+    def fetch(self, endpoint: str, key: str, request: Callable[[], object]) -> CachedResponse:
+        response = self.get(endpoint, key)
+        if response is None:
+            response = CachedResponse.from_response(request())
+            self.set(endpoint, key, response)
+        return response
+
+    async def fetch_async(self, endpoint: str, key: str, request: Callable[[], Awaitable]) -> CachedResponse:
+        # Identical requests running at the same time share one fetch
+        in_flight = self._in_flight.get((endpoint, key))
+        if in_flight is not None:
+            self.hits[endpoint] += 1
+            return await asyncio.shield(in_flight)
+
+        response = self.get(endpoint, key)
+        if response is not None:
+            return response
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[(endpoint, key)] = future
+        try:
+            response = CachedResponse.from_response(await request())
+            self.set(endpoint, key, response)
+            future.set_result(response)
+            return response
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody may be waiting, so retrieve the exception to avoid an unretrieved warning
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[(endpoint, key)]
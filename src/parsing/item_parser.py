@@ -1,10 +1,46 @@
+import math
 from abc import ABC, abstractmethod
+from typing import Hashable, Iterator, Protocol
 
 from src.models import Item, Urls
 
+ItemResult = tuple[str | tuple[str, str], Item | None]
+
+
+class SharedLock(Protocol):
+    # Held by one process at a time, acquire does not wait
+    def acquire(self) -> bool:
+        ...
+
+    def release(self) -> None:
+        ...
+
 
 class ItemParser(ABC):
+    _max_cache_age: float = math.inf
+
     @staticmethod
     @abstractmethod
-    def get_items(urls: Urls) -> list[Item]:
+    def get_items(urls: Urls) -> Iterator[ItemResult]:
+        pass
+
+    @staticmethod
+    def get_product_key(url: str | tuple[str, str]) -> Hashable:
+        # Urls with the same key point at the same product and are parsed once
+        return url
+
+    @classmethod
+    def set_max_cache_age(cls, max_age: float) -> None:
+        # Cached responses older than that are fetched again whatever the TTL of their endpoint,
+        # the cache is opened again with it on the next request
+        cls._max_cache_age = max_age
+        cls.close()
+
+    @staticmethod
+    def set_shared_lock(lock: SharedLock | None) -> None:
+        # Parsers that keep state outside the process, like the Ozon cart, hold the lock while they use it
+        pass
+
+    @staticmethod
+    def close() -> None:
         pass
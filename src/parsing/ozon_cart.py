@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from urllib.parse import urlparse
+
+from curl_cffi.requests import AsyncSession
+
+from src.parsing.item_parser import SharedLock
+from src.parsing.proxy_pool import ProxyPool
+from src.utils import logger, get_rate_limiter, track_request_async
+
+
+class OzonCart:
+    PROBE_QUANTITY = 2000
+    SHARED_LOCK_DELAY = 0.2
+
+    def __init__(self, session: AsyncSession, proxy_pool: ProxyPool, url: str,
+                 batch_size: int, batch_delay: float, shared_lock: SharedLock | None = None) -> None:
+        self._session = session
+        self._proxy_pool = proxy_pool
+        self._url = url
+        self._batch_size = batch_size
+        self._batch_delay = batch_delay
+        self._limiter = get_rate_limiter(urlparse(url).hostname)
+
+        # Every request shares one account cart, so batches must not interleave,
+        # neither here nor in the other processes with the same account
+        self._lock = asyncio.Lock()
+        self._shared_lock = shared_lock
+        self._pending: list[tuple[int, asyncio.Future]] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._flushes: set[asyncio.Task] = set()
+        # Skus whose removal failed are removed along with the next batch
+        self._dirty: list[int] = []
+
+    async def get_quantity(self, sku: int) -> int | None:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((sku, future))
+
+        if len(self._pending) >= self._batch_size:
+            self._schedule_flush(0)
+        elif self._flush_handle is None:
+            self._schedule_flush(self._batch_delay)
+
+        return await future
+
+    def _schedule_flush(self, delay: float) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+
+        self._flush_handle = asyncio.get_running_loop().call_later(delay, self._start_flush)
+
+    def _start_flush(self) -> None:
+        self._flush_handle = None
+        task = asyncio.get_running_loop().create_task(self._flush())
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def close(self) -> None:
+        # Flushes left behind by a caller that stopped early must not outlive the session
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        for task in self._flushes:
+            task.cancel()
+        await asyncio.gather(*self._flushes, return_exceptions=True)
+
+        for _, future in self._pending:
+            future.cancel()
+        self._pending = []
+
+        if self._dirty:
+            async with self._hold():
+                await self._remove(self._dirty)
+
+    @asynccontextmanager
+    async def _hold(self) -> AsyncIterator[None]:
+        # The shared lock is taken without awaiting in between, so a cancelled flush never leaves it held
+        async with self._lock:
+            if self._shared_lock is None:
+                yield
+                return
+
+            while not self._shared_lock.acquire():
+                await asyncio.sleep(self.SHARED_LOCK_DELAY)
+            try:
+                yield
+            finally:
+                self._shared_lock.release()
+
+    async def _flush(self) -> None:
+        batch, self._pending = self._pending[:self._batch_size], self._pending[self._batch_size:]
+        if self._pending:
+            self._schedule_flush(0)
+        if not batch:
+            return
+
+        skus = list(dict.fromkeys(sku for sku, _ in batch))
+        try:
+            async with self._hold():
+                quantities = await self._probe(skus)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # Waiters are cancelled when the caller stops consuming items early
+        for sku, future in batch:
+            if future.done():
+                continue
+            if quantities is None:
+                future.set_result(None)
+            elif sku in quantities:
+                future.set_result(quantities[sku])
+            else:
+                future.set_exception(KeyError(f"Sku {sku} is missing from Ozon cart"))
+
+    async def _probe(self, skus: list[int]) -> dict[int, int] | None:
+        logger.debug(f"Probing quantities for {len(skus)} items...")
+
+        response = await self._limiter.call_async(lambda: self._proxy_pool.request(
+            lambda proxy: track_request_async("ozon_cart", lambda: self._session.post(
+                url=self._url,
+                data=json.dumps([{"id": sku, "quantity": self.PROBE_QUANTITY} for sku in skus]),
+                proxy=proxy,
+            ))
+        ))
+
+        try:
+            if response.status_code != 200:
+                logger.debug(f"Got error response from Ozon cart: {response.status_code}")
+                return None
+
+            return self._get_quantities(response.json())
+        finally:
+            await self._remove(list(dict.fromkeys(self._dirty + skus)))
+
+    async def _remove(self, skus: list[int]) -> None:
+        # Quantities that were read stay valid when the cart is not emptied, it is emptied with the next batch
+        try:
+            await self._limiter.call_async(lambda: self._proxy_pool.request(
+                lambda proxy: track_request_async("ozon_cart", lambda: self._session.post(
+                    url=self._url,
+                    data=json.dumps([{"id": sku} for sku in skus]),
+                    proxy=proxy,
+                ))
+            ))
+        except Exception as e:
+            logger.warning(f"Could not empty Ozon cart of {len(skus)} items: {e}")
+            self._dirty = skus
+        else:
+            self._dirty = []
+
+    @staticmethod
+    def _get_quantities(response: dict) -> dict[int, int]:
+        return {
+            int(cart_item.get("sku", cart_item.get("id"))): cart_item["qty"]
+            for cart_item in response["cart"]["cartItems"]
+        }
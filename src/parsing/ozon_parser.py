@@ -1,30 +1,66 @@
 from __future__ import annotations
 
+import asyncio
+import functools
 import json
 import os
 import re
+from typing import AsyncIterator, Iterator
 
-from the_retry import retry
-from curl_cffi import requests
+from curl_cffi import CurlHttpVersion
+from curl_cffi.requests import AsyncSession
 
 from src.models import Status, OzonUrls, OzonItemPair, OzonItem
 from src.parsing import ItemParser
+from src.parsing.item_parser import ItemResult, SharedLock
+from src.parsing.cache import ResponseCache
+from src.parsing.ozon_cart import OzonCart
+from src.parsing.proxy_pool import ProxyPool
 from src.parsing.exceptions import OutOfStockException
-from src.utils import logger
+from src.utils import logger, get_rate_limiter, track_request_async
 
 
 class OzonParser(ItemParser):
+    CONCURRENCY = int(os.getenv("OZON_CONCURRENCY", 8))
+    CART_BATCH_SIZE = int(os.getenv("OZON_CART_BATCH_SIZE", 50))
+    CART_BATCH_DELAY = 0.5
+    PRODUCT_CACHE_TTL = int(os.getenv("OZON_CACHE_TTL", 60 * 60))
+
     _HEADERS = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 YaBrowser/24.1.0.0 Safari/537.36",
     }
+    _COOKIES = {
+        "__Secure-refresh-token": "7.0.SYkxK0SbQDmpHVoYJlekhQ.27.AerWva9-O_8-OHJlQRm3IhRExoT2P57SRnrAQ5OzeSN4JU7mVOlUx4eEnV50rLM_DA..20250402222635.j1sYDuPdWbOofvVcWx8P9mh8MwU4sfgSUy--fVLNszc.14bcdb1c048d6dded",
+        "abt_data": "7.mnQH91CIDBEENuO5RR0CsCgjWPdOFL0TYfxZCbi-nG-PvBc8Lcy7e7nkYO4CnQfrpjmPopyMaoe3jpFVDGjMXWeQLQ5SdULAQ774fJdLRMy92TeEjzgJNrNwy0I14ba5QvzflpQZaQROoO1Col2e5vDce_Ry_ZZPBvB8OpjE-pMZLGlDRt74QEuxFSXOscVUdj61tQmM4T27gyTKVJ5IgJFrKzHksBQTsNhgIeJtBWMcPkZt58hf2zCf4_wQfCDUn9GebtiLghqUkJfk4o-vDCN8OtBqqOlmcSlcQc7KYQyTnZn15m-A2XyZnICnbCycRif6HVrYmmzz5KQ1XN84mFiI187fSfFLoYmu43dxuaG2zZNu1LT-VUVwa49lIEU1JFh4DkVaU0suwboT3J4EZypUPM1fTQ4mwDlmD0QTXVHvYE0y4DEQdrPJYyfx1sMt4yWhFHQAtx91WYGAIT9qNl5BunWS_VmHphnVjvb60scqJEJKGAhQOPEFK4oK9G2CV36Unylj7431p5O3VTgB3VxMudX0Qx4x2RW5droIPD9fDC780k54fs6TSf69t1C7ab_PJELJ2NQDrNgrWd3P7f9Suh_K_H6P",
+    }
     _BASE_URL = r"https://api.ozon.ru/"
     _PRODUCT_URL = _BASE_URL + r"entrypoint-api.bx/page/json/v2?url=%2Fproduct%2F"
     _ADD_TO_CART_URL = _BASE_URL + r"composer-api.bx/_action/addToCart"
 
+    _VALUE_START = re.compile(r'[^"\\]*"\s*:\s*')
+    _DECODER = json.JSONDecoder()
+
+    # AsyncSession is bound to the loop it was created in, so both live for the whole update
+    _loop: asyncio.AbstractEventLoop | None = None
+    _session: AsyncSession | None = None
+    _cache: ResponseCache | None = None
+    _proxy_pool: ProxyPool | None = None
+    _cart_lock: SharedLock | None = None
+
+    @staticmethod
+    def set_shared_lock(lock: SharedLock | None) -> None:
+        # The cart belongs to the account, so every process that shares the cookies takes turns with it
+        OzonParser._cart_lock = lock
+
     @staticmethod
     def price_to_number(price: str) -> int:
         return int(re.sub(r"\D", "", price))
 
+    @staticmethod
+    def get_product_key(url: tuple[str, str]) -> tuple[int | str, ...]:
+        # Slugs and query strings change, the sku at the end of the slug does not
+        return tuple(OzonParser.extract_url_parts(side_url)[1] or side_url for side_url in url)
+
     @staticmethod
     def extract_url_parts(url) -> tuple[str | None, int | None]:
         updated_regex = r"(?:\/product\/|%2Fproduct%2F)([\w-]+)"
@@ -54,6 +90,34 @@ class OzonParser(ItemParser):
                 price_json = json.loads(value)
                 break
 
+        return OzonParser._parse_price_json(price_json)
+
+    @staticmethod
+    def _find_key(text: str, key_prefix: str) -> int | None:
+        # Keys inside the JSON encoded widget values are escaped, so they are skipped
+        position = text.find(f'"{key_prefix}')
+        while position != -1:
+            if text[position - 1] != "\\":
+                match = OzonParser._VALUE_START.match(text, position + len(key_prefix) + 1)
+                if match is not None:
+                    return match.end()
+            position = text.find(f'"{key_prefix}', position + 1)
+        return None
+
+    @staticmethod
+    def _extract_prices(text: str) -> tuple[int, int | None]:
+        # Pages hold dozens of widgets, so only the webPrice value is decoded instead of the whole payload
+        position = OzonParser._find_key(text, "webPrice-")
+        if position is None:
+            if OzonParser._find_key(text, "widgetStates") is not None:
+                raise OutOfStockException("Item is out of stock")
+            return OzonParser._get_prices(json.loads(text))
+
+        value, _ = OzonParser._DECODER.raw_decode(text, position)
+        return OzonParser._parse_price_json(json.loads(value))
+
+    @staticmethod
+    def _parse_price_json(price_json: dict | None) -> tuple[int, int | None]:
         if price_json is None:
             raise OutOfStockException("Item is out of stock")
 
@@ -66,31 +130,103 @@ class OzonParser(ItemParser):
         )
 
     @staticmethod
-    def _get_quantity(response: dict) -> int:
-        return response["cart"]["cartItems"][0]["qty"]
+    def _get_session() -> AsyncSession:
+        if OzonParser._session is None:
+            OzonParser._session = AsyncSession(
+                loop=OzonParser._loop,
+                max_clients=OzonParser.CONCURRENCY,
+                headers=OzonParser._HEADERS,
+                cookies=OzonParser._COOKIES,
+                impersonate="chrome116",
+                http_version=CurlHttpVersion.V2TLS,
+            )
+        return OzonParser._session
+
+    @staticmethod
+    def _get_cache() -> ResponseCache:
+        if OzonParser._cache is None:
+            OzonParser._cache = ResponseCache({"ozon_product": OzonParser.PRODUCT_CACHE_TTL},
+                                              max_age=OzonParser._max_cache_age)
+        return OzonParser._cache
+
+    @staticmethod
+    def _get_proxy_pool() -> ProxyPool:
+        if OzonParser._proxy_pool is None:
+            OzonParser._proxy_pool = ProxyPool.from_env()
+            get_rate_limiter("api.ozon.ru").scale(len(OzonParser._proxy_pool))
+        return OzonParser._proxy_pool
 
     @staticmethod
-    def get_items(urls: OzonUrls) -> list[OzonItemPair]:
-        items = []
+    def close() -> None:
+        if OzonParser._proxy_pool is not None:
+            OzonParser._proxy_pool.log_stats()
+            OzonParser._proxy_pool = None
 
-        for urls_tuple in urls:
-            fbs, fbo = None, None
-            if urls_tuple[0] != "":
-                fbs = OzonParser._get_item(urls_tuple[0])
-            if urls_tuple[1] != "":
-                fbo = OzonParser._get_item(urls_tuple[1])
+        if OzonParser._cache is not None:
+            OzonParser._cache.close()
+            OzonParser._cache = None
 
-            if fbo or fbs:
-                items.append(OzonItemPair(fbs=fbs, fbo=fbo))
+        if OzonParser._loop is None:
+            return
 
-        return items
+        if OzonParser._session is not None:
+            OzonParser._loop.run_until_complete(OzonParser._session.close())
+            OzonParser._session = None
+
+        OzonParser._loop.close()
+        OzonParser._loop = None
+
+    @staticmethod
+    def get_items(urls: OzonUrls, concurrency: int | None = None) -> Iterator[ItemResult]:
+        if OzonParser._loop is None:
+            OzonParser._loop = asyncio.new_event_loop()
+
+        # The loop only runs while the caller asks for the next item, which holds parsing back when it lags
+        items = OzonParser._iter_items(urls, concurrency or OzonParser.CONCURRENCY)
+        try:
+            while True:
+                try:
+                    yield OzonParser._loop.run_until_complete(items.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            OzonParser._loop.run_until_complete(items.aclose())
+
+    @staticmethod
+    async def _iter_items(urls: OzonUrls, concurrency: int) -> AsyncIterator[ItemResult]:
+        session = OzonParser._get_session()
+        semaphore = asyncio.Semaphore(concurrency)
+        proxy_pool = OzonParser._get_proxy_pool()
+        cart = OzonCart(session, proxy_pool, OzonParser._ADD_TO_CART_URL,
+                        OzonParser.CART_BATCH_SIZE, OzonParser.CART_BATCH_DELAY, OzonParser._cart_lock)
+
+        async def get_item(url: str) -> OzonItem | None:
+            if url == "":
+                return None
+            return await OzonParser._get_item(session, proxy_pool, semaphore, cart, url)
+
+        async def get_item_pair(urls_tuple: tuple[str, str]) -> ItemResult:
+            fbs, fbo = await asyncio.gather(get_item(urls_tuple[0]), get_item(urls_tuple[1]))
+            return urls_tuple, OzonItemPair(fbs=fbs, fbo=fbo) if fbs or fbo else None
+
+        tasks = [asyncio.ensure_future(get_item_pair(urls_tuple)) for urls_tuple in dict.fromkeys(urls)]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await cart.close()
 
     @staticmethod
     def return_error_item_on_exception(raise_exception=False):
         def decorator(func):
-            def get_item(url: str):
+            @functools.wraps(func)
+            async def get_item(*args):
+                url = args[-1]
                 try:
-                    item = func(url)
+                    item = await func(*args)
                 except Exception as e:
                     if raise_exception:
                         raise e
@@ -104,8 +240,8 @@ class OzonParser(ItemParser):
 
     @staticmethod
     @return_error_item_on_exception()
-    @retry(attempts=3, backoff=5, exponential_backoff=True)
-    def _get_item(url: str) -> OzonItem | None:
+    async def _get_item(session: AsyncSession, proxy_pool: ProxyPool, semaphore: asyncio.Semaphore,
+                        cart: OzonCart, url: str) -> OzonItem | None:
         logger.info(f"Getting item from: {url}...")
 
         url_part, sku = OzonParser.extract_url_parts(url)
@@ -114,14 +250,18 @@ class OzonParser(ItemParser):
             logger.debug(f"Wrong url passed ({url})")
             return None
 
-        proxy_url = os.environ.get("PROXY_URL")
-
-        response_price = requests.get(
-            url=OzonParser._PRODUCT_URL + url_part,
-            headers=OzonParser._HEADERS,
-            impersonate="chrome116",
-            proxies={"https": proxy_url},
-        )
+        async with semaphore:
+            response_price = await OzonParser._get_cache().fetch_async(
+                "ozon_product", url_part,
+                lambda: get_rate_limiter("api.ozon.ru").call_async(
+                    lambda: proxy_pool.request(
+                        lambda proxy: track_request_async(
+                            "ozon_product",
+                            lambda: session.get(url=OzonParser._PRODUCT_URL + url_part, proxy=proxy),
+                        )
+                    )
+                ),
+            )
 
         if response_price.status_code != 200:
             logger.debug(
@@ -130,33 +270,17 @@ class OzonParser(ItemParser):
             return None
 
         try:
-            price, green_price = OzonParser._get_prices(response_price.json())
+            price, green_price = OzonParser._extract_prices(response_price.text)
         except OutOfStockException as e:
             logger.info(e)
             return OzonItem(url=url, status=Status.OUT_OF_STOCK)
 
         _, redirect_sku = OzonParser.extract_url_parts(response_price.url)
 
-        response_quantity = requests.post(
-            url=OzonParser._ADD_TO_CART_URL,
-            data=json.dumps([{"id": redirect_sku, "quantity": 2000}]),
-            headers=OzonParser._HEADERS,
-            impersonate="chrome116",
-            cookies={
-                "__Secure-refresh-token": "7.0.SYkxK0SbQDmpHVoYJlekhQ.27.AerWva9-O_8-OHJlQRm3IhRExoT2P57SRnrAQ5OzeSN4JU7mVOlUx4eEnV50rLM_DA..20250402222635.j1sYDuPdWbOofvVcWx8P9mh8MwU4sfgSUy--fVLNszc.14bcdb1c048d6dded",
-                "abt_data": "7.mnQH91CIDBEENuO5RR0CsCgjWPdOFL0TYfxZCbi-nG-PvBc8Lcy7e7nkYO4CnQfrpjmPopyMaoe3jpFVDGjMXWeQLQ5SdULAQ774fJdLRMy92TeEjzgJNrNwy0I14ba5QvzflpQZaQROoO1Col2e5vDce_Ry_ZZPBvB8OpjE-pMZLGlDRt74QEuxFSXOscVUdj61tQmM4T27gyTKVJ5IgJFrKzHksBQTsNhgIeJtBWMcPkZt58hf2zCf4_wQfCDUn9GebtiLghqUkJfk4o-vDCN8OtBqqOlmcSlcQc7KYQyTnZn15m-A2XyZnICnbCycRif6HVrYmmzz5KQ1XN84mFiI187fSfFLoYmu43dxuaG2zZNu1LT-VUVwa49lIEU1JFh4DkVaU0suwboT3J4EZypUPM1fTQ4mwDlmD0QTXVHvYE0y4DEQdrPJYyfx1sMt4yWhFHQAtx91WYGAIT9qNl5BunWS_VmHphnVjvb60scqJEJKGAhQOPEFK4oK9G2CV36Unylj7431p5O3VTgB3VxMudX0Qx4x2RW5droIPD9fDC780k54fs6TSf69t1C7ab_PJELJ2NQDrNgrWd3P7f9Suh_K_H6P",
-            },
-            proxies={"https": proxy_url},
-        )
-
-        if response_quantity.status_code != 200:
-            logger.debug(
-                f"Got error response from Ozon cart: {response_quantity.status_code}"
-            )
+        quantity = await cart.get_quantity(redirect_sku)
+        if quantity is None:
             return None
 
-        quantity = OzonParser._get_quantity(response_quantity.json())
-
         item = OzonItem(
             url=url,
             quantity=quantity,
@@ -165,24 +289,12 @@ class OzonParser(ItemParser):
             green_price=green_price,
         )
 
-        response_quantity = requests.post(
-            url=OzonParser._ADD_TO_CART_URL,
-            data=json.dumps([{"id": redirect_sku}]),
-            headers=OzonParser._HEADERS,
-            impersonate="chrome116",
-            cookies={
-                "__Secure-refresh-token": "7.0.SYkxK0SbQDmpHVoYJlekhQ.27.AerWva9-O_8-OHJlQRm3IhRExoT2P57SRnrAQ5OzeSN4JU7mVOlUx4eEnV50rLM_DA..20250402222635.j1sYDuPdWbOofvVcWx8P9mh8MwU4sfgSUy--fVLNszc.14bcdb1c048d6dded",
-                "abt_data": "7.mnQH91CIDBEENuO5RR0CsCgjWPdOFL0TYfxZCbi-nG-PvBc8Lcy7e7nkYO4CnQfrpjmPopyMaoe3jpFVDGjMXWeQLQ5SdULAQ774fJdLRMy92TeEjzgJNrNwy0I14ba5QvzflpQZaQROoO1Col2e5vDce_Ry_ZZPBvB8OpjE-pMZLGlDRt74QEuxFSXOscVUdj61tQmM4T27gyTKVJ5IgJFrKzHksBQTsNhgIeJtBWMcPkZt58hf2zCf4_wQfCDUn9GebtiLghqUkJfk4o-vDCN8OtBqqOlmcSlcQc7KYQyTnZn15m-A2XyZnICnbCycRif6HVrYmmzz5KQ1XN84mFiI187fSfFLoYmu43dxuaG2zZNu1LT-VUVwa49lIEU1JFh4DkVaU0suwboT3J4EZypUPM1fTQ4mwDlmD0QTXVHvYE0y4DEQdrPJYyfx1sMt4yWhFHQAtx91WYGAIT9qNl5BunWS_VmHphnVjvb60scqJEJKGAhQOPEFK4oK9G2CV36Unylj7431p5O3VTgB3VxMudX0Qx4x2RW5droIPD9fDC780k54fs6TSf69t1C7ab_PJELJ2NQDrNgrWd3P7f9Suh_K_H6P",
-            },
-            proxies={"https": proxy_url},
-        )
-
         logger.info(f"Got item: {item}")
         return item
 
 
 def test_run():
-    print(OzonParser._get_item(input("Enter url: ")))
+    print(list(OzonParser.get_items(OzonUrls([(input("Enter url: "), "")]))))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+from urllib.parse import urlparse
+
+from src.utils import logger
+
+
+@dataclass
+class Proxy:
+    url: str | None
+    requests: int = 0
+    failures: int = 0
+    latency: float = 0.0
+    in_flight: int = 0
+    benched_until: float = 0.0
+    benches: int = 0
+
+    @property
+    def name(self) -> str:
+        if self.url is None:
+            return "direct"
+        parsed = urlparse(self.url)
+        return f"{parsed.hostname}:{parsed.port}" if parsed.port else str(parsed.hostname)
+
+    @property
+    def failure_rate(self) -> float:
+        return self.failures / self.requests if self.requests else 0.0
+
+    @property
+    def score(self) -> float:
+        # Latencies below the floor are treated as equal so that new proxies get picked too
+        return (self.in_flight + 1) * max(self.latency, 0.1) * (1 + 4 * self.failure_rate)
+
+
+class ProxyPool:
+    MAX_ATTEMPTS = 3
+    BENCH_TIME = 60
+    MAX_BENCH_TIME = 15 * 60
+    BENCH_STATUSES = (403, 429)
+
+    def __init__(self, urls: list[str | None]) -> None:
+        self._proxies = [Proxy(url) for url in dict.fromkeys(urls)] or [Proxy(None)]
+        self._turn = 0
+
+    def __len__(self) -> int:
+        return len(self._proxies)
+
+    @staticmethod
+    def from_env() -> ProxyPool:
+        urls = [url.strip() for url in os.getenv("PROXY_URLS", "").split(",")]
+
+        proxy_file = os.getenv("PROXY_FILE")
+        if proxy_file:
+            with open(proxy_file) as file:
+                urls += [line.strip() for line in file]
+
+        if os.getenv("PROXY_URL"):
+            urls.append(os.environ["PROXY_URL"])
+
+        return ProxyPool([url for url in urls if url and not url.startswith("#")])
+
+    def _choose(self) -> Proxy:
+        now = time.monotonic()
+        available = [proxy for proxy in self._proxies if proxy.benched_until <= now]
+        if not available:
+            return min(self._proxies, key=lambda proxy: proxy.benched_until)
+
+        # Rotate the starting point so that ties are spread round-robin
+        self._turn += 1
+        start = self._turn % len(available)
+        return min(available[start:] + available[:start], key=lambda proxy: proxy.score)
+
+    def _report(self, proxy: Proxy, status_code: int | None, elapsed: float) -> None:
+        proxy.requests += 1
+
+        if status_code is None or status_code >= 500 or status_code in self.BENCH_STATUSES:
+            proxy.failures += 1
+        else:
+            proxy.latency = elapsed if not proxy.latency else 0.8 * proxy.latency + 0.2 * elapsed
+
+        if status_code in self.BENCH_STATUSES:
+            proxy.benches += 1
+            bench_time = min(self.MAX_BENCH_TIME, self.BENCH_TIME * 2 ** (proxy.benches - 1))
+            proxy.benched_until = time.monotonic() + bench_time
+            logger.warning(f"Proxy {proxy.name} got {status_code}, benched for {bench_time}s")
+        elif status_code is not None and status_code < 400:
+            proxy.benches = 0
+
+    async def request(self, send: Callable[[str | None], Awaitable]):
+        attempts = min(len(self), self.MAX_ATTEMPTS)
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            proxy = self._choose()
+
+            wait = proxy.benched_until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            proxy.in_flight += 1
+            start = time.monotonic()
+            try:
+                response = await send(proxy.url)
+            except Exception:
+                self._report(proxy, None, time.monotonic() - start)
+                if last_attempt:
+                    raise
+                continue
+            finally:
+                proxy.in_flight -= 1
+
+            self._report(proxy, response.status_code, time.monotonic() - start)
+            if response.status_code not in self.BENCH_STATUSES or last_attempt:
+                return response
+
+    def stats(self) -> list[dict]:
+        now = time.monotonic()
+        return [
+            {
+                "proxy": proxy.name,
+                "requests": proxy.requests,
+                "failure_rate": round(proxy.failure_rate, 3),
+                "latency": round(proxy.latency, 3),
+                "benched_for": round(max(proxy.benched_until - now, 0), 1),
+            }
+            for proxy in self._proxies
+        ]
+
+    def log_stats(self) -> None:
+        for stats in self.stats():
+            logger.info(f"Proxy {stats['proxy']}: {stats['requests']} requests, "
+                        f"{stats['failure_rate']:.1%} failed, {stats['latency']}s latency")
@@ -1,62 +1,140 @@
+import json
+import os
 import re
+from typing import Iterator
 
 from requests import Session
+from requests.adapters import HTTPAdapter
 
 from src.models import Status, WildberriesUrls, WildberriesItem
 from src.parsing import ItemParser
-from src.utils import logger
+from src.parsing.item_parser import ItemResult
+from src.parsing.cache import CachedResponse, ResponseCache
+from src.utils import logger, get_rate_limiter, track_request
 
 
 class WildberriesParser(ItemParser):
     NO_SALE_AMOUNT = 0
     SALE_AMOUNT = 27
     DESTINATION = -1257786
+    CARD_URL = "https://card.wb.ru/cards/detail"
+    CHUNK_SIZE = 100
+    POOL_SIZE = 4
+    CARD_CACHE_TTL = int(os.getenv("WILDBERRIES_CACHE_TTL", 60 * 60))
+
+    _session: Session | None = None
+    _cache: ResponseCache | None = None
 
     @staticmethod
-    def get_items(urls: WildberriesUrls) -> list[WildberriesItem]:
-        items = []
-
-        for url in urls:
-            logger.info(f"Getting item from \"{url}\"...")
-
-            code = re.findall(r"catalog\/(\d+)", url)[0]
-
-            try:
-                quantity, sale_price, status = WildberriesParser._get_item_values(code, WildberriesParser.SALE_AMOUNT)
-                _, no_sale_price, _ = WildberriesParser._get_item_values(code, WildberriesParser.NO_SALE_AMOUNT)
-            except ValueError as e:
-                logger.warning(e)
-                continue
-
-            item = WildberriesItem(
-                url=url,
-                quantity=quantity,
-                sale_price=sale_price,
-                no_sale_price=no_sale_price,
-                status=status,
-            )
-            items.append(item)
+    def _get_session() -> Session:
+        if WildberriesParser._session is None:
+            session = Session()
+            session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=WildberriesParser.POOL_SIZE))
+            WildberriesParser._session = session
+        return WildberriesParser._session
+
+    @staticmethod
+    def _get_cache() -> ResponseCache:
+        if WildberriesParser._cache is None:
+            WildberriesParser._cache = ResponseCache({"wildberries_card": WildberriesParser.CARD_CACHE_TTL},
+                                                    max_age=WildberriesParser._max_cache_age)
+        return WildberriesParser._cache
+
+    @staticmethod
+    def close() -> None:
+        if WildberriesParser._cache is not None:
+            WildberriesParser._cache.close()
+            WildberriesParser._cache = None
 
-            logger.info(f"Got item: {item}")
+        if WildberriesParser._session is not None:
+            WildberriesParser._session.close()
+            WildberriesParser._session = None
 
-        return items
+    @staticmethod
+    def get_product_key(url: str) -> str:
+        try:
+            return WildberriesParser.extract_code(url)
+        except IndexError:
+            return url
 
     @staticmethod
-    def _get_item_values(code: str, sale_amount: int) -> tuple[int, int, Status]:
-        with Session() as session:
-            card_url = "https://card.wb.ru/cards/detail"
+    def extract_code(url: str) -> str:
+        return re.findall(r"catalog\/(\d+)", url)[0]
+
+    @staticmethod
+    def get_items(urls: WildberriesUrls) -> Iterator[ItemResult]:
+        urls_by_code = {}
+        for url in dict.fromkeys(urls):
+            urls_by_code.setdefault(WildberriesParser.extract_code(url), []).append(url)
+        codes = list(urls_by_code)
+
+        for i in range(0, len(codes), WildberriesParser.CHUNK_SIZE):
+            chunk = codes[i:i + WildberriesParser.CHUNK_SIZE]
+            logger.info(f"Getting items {i + 1}-{i + len(chunk)} of {len(codes)}...")
+
+            sale_values = WildberriesParser._get_items_values(chunk, WildberriesParser.SALE_AMOUNT)
+            no_sale_values = WildberriesParser._get_items_values(chunk, WildberriesParser.NO_SALE_AMOUNT)
+
+            for code in chunk:
+                for url in urls_by_code[code]:
+                    yield url, WildberriesParser._get_item(url, code, sale_values, no_sale_values)
+
+    @staticmethod
+    def _get_item(url: str, code: str,
+                  sale_values: dict[str, tuple[int, int, Status]],
+                  no_sale_values: dict[str, tuple[int, int, Status]]) -> WildberriesItem | None:
+        if code not in sale_values or code not in no_sale_values:
+            logger.warning(ValueError(f"Item with code \"{code}\" not found"))
+            return None
+
+        quantity, sale_price, status = sale_values[code]
+        _, no_sale_price, _ = no_sale_values[code]
+
+        item = WildberriesItem(
+            url=url,
+            quantity=quantity,
+            sale_price=sale_price,
+            no_sale_price=no_sale_price,
+            status=status,
+        )
+
+        logger.info(f"Got item: {item}")
+        return item
+
+    @staticmethod
+    def _get_items_values(codes: list[str], sale_amount: int) -> dict[str, tuple[int, int, Status]]:
+        # Every product is cached on its own, so a chunk only requests the codes missing from the cache
+        cache = WildberriesParser._get_cache()
+        cached = cache.get_many("wildberries_card", [f"{code}|{sale_amount}" for code in codes])
+        goods = {code: cached[f"{code}|{sale_amount}"].json() for code in codes if f"{code}|{sale_amount}" in cached}
+
+        missing = [code for code in codes if code not in goods]
+        if missing:
             params = {
-                "nm": code,
+                "nm": ";".join(missing),
                 "spp": sale_amount,
                 "dest": WildberriesParser.DESTINATION,
             }
-            response = session.get(card_url, params=params)
-        response_json = response.json()
+            response = get_rate_limiter("card.wb.ru").call(
+                lambda: track_request(
+                    "wildberries_card",
+                    lambda: WildberriesParser._get_session().get(WildberriesParser.CARD_URL, params=params),
+                )
+            )
+            response_json = response.json()
 
-        if not response_json.get("data").get("products"):
-            raise ValueError(f"Item with code \"{code}\" not found")
+            products = response_json.get("data").get("products") or []
+            fetched = {str(good.get("id")): good for good in products}
+            cache.set_many("wildberries_card", {
+                f"{code}|{sale_amount}": CachedResponse(response.status_code, str(response.url), json.dumps(good))
+                for code, good in fetched.items()
+            })
+            goods.update(fetched)
 
-        good = response_json.get("data").get("products")[0]
+        return {code: WildberriesParser._get_good_values(good) for code, good in goods.items()}
+
+    @staticmethod
+    def _get_good_values(good: dict) -> tuple[int, int, Status]:
         price = int(good.get("salePriceU") / 100)
 
         status = Status.OUT_OF_STOCK
@@ -70,7 +148,7 @@ class WildberriesParser(ItemParser):
 
 
 def test_run():
-    print(WildberriesParser.get_items(["https://www.wildberries.ru/catalog/74441434/detail.aspx"]))
+    print(list(WildberriesParser.get_items(WildberriesUrls(["https://www.wildberries.ru/catalog/74441434/detail.aspx"]))))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,117 @@
+import math
+import os
+from datetime import datetime, timedelta
+
+from src.models import ItemBatch, OzonItem, OzonItemPair, Status, WildberriesItem
+from src.models.item.item_batch import Key
+from src.storage import HistoryRecord, HistoryStore
+
+Side = tuple[str, str | None]
+
+
+class PollingPolicy:
+    # Every item is polled about as often as its price, stock or status changed in its last records,
+    # an item that did not change waits as long as it has been seen unchanged. Without POLL_MAX_INTERVAL
+    # every item is fetched on every update.
+    MIN_INTERVAL = int(os.getenv("POLL_MIN_INTERVAL", 60 * 60))
+    MAX_INTERVAL = int(os.getenv("POLL_MAX_INTERVAL", 0))
+    REQUEST_BUDGET = int(os.getenv("POLL_REQUEST_BUDGET", 0))
+    CHECK_INTERVAL = int(os.getenv("POLL_CHECK_INTERVAL", 15 * 60))
+    WINDOW = int(os.getenv("POLL_WINDOW", 14 * 24 * 60 * 60))
+    RECORDS = int(os.getenv("POLL_RECORDS", 10))
+    QUANTITY_TOLERANCE = 0.1
+
+    def __init__(self, history: HistoryStore, marketplace: str) -> None:
+        self._history = history
+        self._marketplace = marketplace
+
+    @classmethod
+    def enabled(cls) -> bool:
+        return cls.MAX_INTERVAL > 0
+
+    @classmethod
+    def get_max_cache_age(cls) -> float:
+        # An item is due again MIN_INTERVAL - CHECK_INTERVAL after its last fetch at the earliest,
+        # a cached response that old would be recorded as a new observation of the same values
+        if not cls.enabled():
+            return math.inf
+        return max(cls.MIN_INTERVAL - cls.CHECK_INTERVAL, 0)
+
+    def plan(self, urls: list[Key], complete: bool = True) -> tuple[list[Key], ItemBatch]:
+        # Returns the urls to fetch in their order and, for a complete run, the last known items of the others.
+        # The most overdue urls are fetched first within the budget, but a complete run fetches the urls
+        # that have nothing to carry over regardless of it.
+        if not self.enabled():
+            return list(urls), ItemBatch()
+
+        now = datetime.now()
+        records = self._get_records(now)
+        scores, latest = {}, {}
+        for url in urls:
+            scores[url], latest[url] = self._score(url, records, now)
+
+        due = sorted((url for url in dict.fromkeys(urls) if scores[url] >= 1), key=scores.get, reverse=True)
+        fetch = due
+        if self.REQUEST_BUDGET:
+            fetch = due[:self.REQUEST_BUDGET]
+            if complete:
+                fetch += [url for url in due[self.REQUEST_BUDGET:] if latest[url] is None]
+
+        fetch = set(fetch)
+        carried = ItemBatch()
+        if complete:
+            carried = ItemBatch.from_results((url, latest[url]) for url in urls if url not in fetch)
+        return [url for url in urls if url in fetch], carried
+
+    def _get_records(self, now: datetime) -> dict[Side, list[HistoryRecord]]:
+        since = now - timedelta(seconds=max(self.WINDOW, self.MAX_INTERVAL))
+        records = {}
+        for record in self._history.get_recent(self._marketplace, since, self.RECORDS):
+            records.setdefault((record.item.url, record.fulfillment), []).append(record)
+        return records
+
+    def _score(self, url: Key, records: dict[Side, list[HistoryRecord]],
+               now: datetime) -> tuple[float, OzonItemPair | WildberriesItem | None]:
+        # The score is the elapsed share of the interval, an url is due once any of its sides is.
+        # Failed items are not carried over.
+        if isinstance(url, tuple):
+            sides = list(zip(url, ("FBS", "FBO")))
+        else:
+            sides = [(url, None)]
+
+        score, items = 0.0, []
+        for side in sides:
+            side_records = records.get(side)
+            if not side[0]:
+                items.append(None)
+                continue
+            if not side_records or side_records[-1].item.status == Status.PARSING_ERROR:
+                return math.inf, None
+
+            last = side_records[-1]
+            elapsed = (now - last.taken_at).total_seconds() + self.CHECK_INTERVAL
+            score = max(score, elapsed / self._get_interval(side_records))
+            items.append(last.item)
+
+        if isinstance(url, tuple):
+            return score, OzonItemPair(fbs=items[0], fbo=items[1]) if any(items) else None
+        return score, items[0]
+
+    def _get_interval(self, records: list[HistoryRecord]) -> float:
+        if len(records) < 2:
+            return self.MIN_INTERVAL
+
+        changes = sum(self._changed(previous.item, record.item) for previous, record in zip(records, records[1:]))
+        span = (records[-1].taken_at - records[0].taken_at).total_seconds()
+        interval = span / changes if changes else span
+        return min(max(interval, self.MIN_INTERVAL), self.MAX_INTERVAL)
+
+    @classmethod
+    def _changed(cls, previous: OzonItem | WildberriesItem, item: OzonItem | WildberriesItem) -> bool:
+        if previous.status != item.status:
+            return True
+        if abs(previous.quantity - item.quantity) > cls.QUANTITY_TOLERANCE * max(previous.quantity, item.quantity):
+            return True
+        if isinstance(item, WildberriesItem):
+            return (previous.sale_price, previous.no_sale_price) != (item.sale_price, item.no_sale_price)
+        return (previous.price, previous.green_price) != (item.price, item.green_price)
@@ -0,0 +1,72 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timedelta
+from typing import Callable, TypeVar
+
+from src.utils import logger
+
+T = TypeVar("T")
+
+# The update job and the job that runs between updates, if any
+Jobs = tuple[Callable[[], None], Callable[[], None] | None]
+
+
+class Scheduler:
+    SETUP_RETRY_DELAY = 60
+
+    def __init__(self) -> None:
+        self._jobs: list[tuple[str, str, Callable[[], Jobs], float]] = []
+
+    def every_day_at(self, at: str, name: str, setup: Callable[[], Jobs], poll_every: float = 0) -> None:
+        # setup runs in the job's own thread and returns the jobs, so that the objects it creates stay there.
+        # The poll job runs every poll_every seconds between the updates.
+        self._jobs.append((at, name, setup, poll_every))
+
+    @staticmethod
+    def _seconds_until(at: str) -> float:
+        now = datetime.now()
+        next_run = datetime.combine(now.date(), time.fromisoformat(at))
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        return (next_run - now).total_seconds()
+
+    async def run(self, immediately: bool = False) -> None:
+        await asyncio.gather(*(self._run_job(at, name, setup, poll_every, immediately)
+                               for at, name, setup, poll_every in self._jobs))
+
+    async def _run_job(self, at: str, name: str, setup: Callable[[], Jobs], poll_every: float,
+                       immediately: bool) -> None:
+        # Every job keeps one thread, its runs never overlap but the jobs run alongside each other
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix=name) as executor:
+            while True:
+                try:
+                    job, poll = await self._call(executor, setup)
+                    break
+                except Exception as e:
+                    logger.exception(e)
+                    await asyncio.sleep(self.SETUP_RETRY_DELAY)
+
+            if immediately:
+                await self._run(executor, name, job)
+
+            while True:
+                delay = self._seconds_until(at)
+                logger.info(f"Next {name} update at {datetime.now() + timedelta(seconds=delay):%d/%m %H:%M}")
+                while poll is not None and poll_every and delay > poll_every:
+                    await asyncio.sleep(poll_every)
+                    await self._run(executor, name, poll, "poll")
+                    delay = self._seconds_until(at)
+                await asyncio.sleep(delay)
+                await self._run(executor, name, job)
+
+    @staticmethod
+    async def _call(executor: ThreadPoolExecutor, func: Callable[[], T]) -> T:
+        return await asyncio.get_running_loop().run_in_executor(executor, func)
+
+    async def _run(self, executor: ThreadPoolExecutor, name: str, job: Callable[[], None],
+                   kind: str = "update") -> None:
+        logger.info(f"Starting {name} {kind}...")
+        try:
+            await self._call(executor, job)
+        except Exception as e:
+            logger.exception(e)
@@ -1,4 +1,5 @@
 from .cell_formats import CellFormat
+from .restrictions import Violation, find_violations
 from .sheets import Sheets
 from .ozon_sheets import OzonSheets
 from .wildberries_sheets import WildberriesSheets
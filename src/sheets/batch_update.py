@@ -0,0 +1,173 @@
+import re
+
+from gspread import Worksheet
+from gspread.utils import a1_range_to_grid_range
+
+from src.utils import logger, get_rate_limiter, track_request
+
+
+class BatchUpdate:
+    MAX_REQUESTS = 500
+
+    _NUMBER_REGEX = re.compile(r"-?\d+(\.\d+)?")
+
+    def __init__(self, sheet: Worksheet) -> None:
+        self._sheet = sheet
+        self._steps: list[tuple[str, list[dict]]] = []
+
+    def __len__(self) -> int:
+        return sum(len(requests) for _, requests in self._steps)
+
+    @property
+    def _requests(self) -> list[dict]:
+        if not self._steps:
+            self.step("requests")
+        return self._steps[-1][1]
+
+    def step(self, name: str) -> None:
+        self._steps.append((name, []))
+
+    def clear(self) -> None:
+        self._steps = []
+
+    def _grid_range(self, cells_range: str) -> dict:
+        return a1_range_to_grid_range(cells_range, self._sheet.id)
+
+    @staticmethod
+    def _user_entered_value(value: str) -> dict:
+        if value.startswith("="):
+            return {"formulaValue": value}
+        if BatchUpdate._NUMBER_REGEX.fullmatch(value):
+            return {"numberValue": float(value)}
+        return {"stringValue": value}
+
+    def insert_cols(self, values: list[list[str]], col: int) -> None:
+        self._requests.append({
+            "insertDimension": {
+                "range": {
+                    "sheetId": self._sheet.id,
+                    "dimension": "COLUMNS",
+                    "startIndex": col - 1,
+                    "endIndex": col - 1 + len(values),
+                },
+            },
+        })
+
+        self.update_cells(values, row=1, col=col)
+
+    def update_cells(self, values: list[list[str]], row: int, col: int) -> None:
+        rows = max(map(len, values), default=0)
+        self._requests.append({
+            "updateCells": {
+                "start": {"sheetId": self._sheet.id, "rowIndex": row - 1, "columnIndex": col - 1},
+                "rows": [
+                    {"values": [
+                        {"userEnteredValue": self._user_entered_value(str(column[i]))}
+                        if i < len(column) and str(column[i]) != "" else {}
+                        for column in values
+                    ]}
+                    for i in range(rows)
+                ],
+                "fields": "userEnteredValue",
+            },
+        })
+
+    def update_formats(self, formats: list[dict], row: int, col: int) -> None:
+        # Every cell of the column gets its own format in one request, the fields are the ones of the first cell
+        self._requests.append({
+            "updateCells": {
+                "start": {"sheetId": self._sheet.id, "rowIndex": row - 1, "columnIndex": col - 1},
+                "rows": [{"values": [{"userEnteredFormat": cell_format}]} for cell_format in formats],
+                "fields": "userEnteredFormat(%s)" % ",".join(formats[0].keys()),
+            },
+        })
+
+    def move_cols(self, target: Worksheet, col: int, count: int, target_col: int) -> None:
+        # The target gets an absolute column count, so the columns already there never move
+        self._requests.append({
+            "updateSheetProperties": {
+                "properties": {
+                    "sheetId": target.id,
+                    "gridProperties": {"columnCount": max(target.col_count, target_col - 1 + count)},
+                },
+                "fields": "gridProperties.columnCount",
+            },
+        })
+        self._requests.append({
+            "copyPaste": {
+                "source": {
+                    "sheetId": self._sheet.id,
+                    "startColumnIndex": col - 1,
+                    "endColumnIndex": col - 1 + count,
+                },
+                "destination": {
+                    "sheetId": target.id,
+                    "startColumnIndex": target_col - 1,
+                    "endColumnIndex": target_col - 1 + count,
+                },
+                "pasteType": "PASTE_NORMAL",
+            },
+        })
+        self._requests.append({
+            "deleteDimension": {
+                "range": {
+                    "sheetId": self._sheet.id,
+                    "dimension": "COLUMNS",
+                    "startIndex": col - 1,
+                    "endIndex": col - 1 + count,
+                },
+            },
+        })
+
+    def format(self, cells_range: str, cell_format: dict) -> None:
+        self._requests.append({
+            "repeatCell": {
+                "range": self._grid_range(cells_range),
+                "cell": {"userEnteredFormat": cell_format},
+                "fields": "userEnteredFormat(%s)" % ",".join(cell_format.keys()),
+            },
+        })
+
+    def add_border(self, cells_range: str, border: dict) -> None:
+        self._requests.append({
+            "updateBorders": {
+                "range": self._grid_range(cells_range),
+                "top": border,
+                "bottom": border,
+                "left": border,
+                "right": border,
+            },
+        })
+
+    def merge_cells(self, cells_range: str) -> None:
+        self._requests.append({
+            "mergeCells": {
+                "range": self._grid_range(cells_range),
+                "mergeType": "MERGE_ALL",
+            },
+        })
+
+    def get_chunks(self) -> list[tuple[str, list[dict]]]:
+        # Every chunk is sent as one atomic batch update, steps are only split when they do not fit in one
+        chunks = []
+        for name, requests in self._steps:
+            for i in range(0, len(requests), self.MAX_REQUESTS):
+                part = requests[i:i + self.MAX_REQUESTS]
+                if chunks and len(chunks[-1][1]) + len(part) <= self.MAX_REQUESTS:
+                    chunks[-1] = (f"{chunks[-1][0]}, {name}", chunks[-1][1] + part)
+                else:
+                    chunks.append((name, part))
+        return chunks
+
+    def send(self, requests: list[dict], idempotent: bool = True) -> None:
+        logger.debug(f"Sending batch update with {len(requests)} requests...")
+        get_rate_limiter("sheets.googleapis.com").call(
+            lambda: track_request("sheets_batch_update",
+                                  lambda: self._sheet.spreadsheet.batch_update({"requests": requests})),
+            idempotent=idempotent,
+        )
+
+    def execute(self) -> None:
+        chunks, self._steps = self.get_chunks(), []
+        for _, requests in chunks:
+            self.send(requests)
@@ -0,0 +1,71 @@
+import json
+import os
+import time
+
+from src.storage.sqlite_store import SqliteStore
+from src.utils import logger
+
+
+class ExportJournal(SqliteStore):
+    PATH = os.getenv("EXPORT_JOURNAL_PATH", "data/export_journal.sqlite3")
+    LAST_PHASE = "finish"
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS phases (
+            name TEXT NOT NULL,
+            run TEXT NOT NULL,
+            phase TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            step TEXT NOT NULL,
+            requests TEXT NOT NULL,
+            completed_at REAL,
+            PRIMARY KEY (name, run, phase, position)
+        );
+    """
+
+    def __init__(self, name: str, path: str | None = None) -> None:
+        # Sheets are exported from a worker pool, one task at a time per journal
+        super().__init__(path)
+        self._name = name
+
+    def get_unfinished_run(self) -> str | None:
+        # A run is finished once every step of its last phase went through
+        rows = self._query(
+            "SELECT run FROM phases WHERE name = ? GROUP BY run "
+            "HAVING SUM(completed_at IS NULL) > 0 OR SUM(phase = ?) = 0 ORDER BY run DESC LIMIT 1",
+            (self._name, self.LAST_PHASE),
+        )
+        return rows[0][0] if rows else None
+
+    def get_pending(self, run: str, phase: str) -> list[tuple[int, str, list[dict]]] | None:
+        rows = self._query(
+            "SELECT position, step, requests, completed_at FROM phases "
+            "WHERE name = ? AND run = ? AND phase = ? ORDER BY position",
+            (self._name, run, phase),
+        )
+        if not rows:
+            return None
+
+        return [(position, step, json.loads(requests))
+                for position, step, requests, completed_at in rows if completed_at is None]
+
+    def plan(self, run: str, phase: str, steps: list[tuple[str, list[dict]]]) -> list[tuple[int, str, list[dict]]]:
+        previous_run = self.get_unfinished_run()
+        if previous_run is not None and previous_run != run:
+            logger.warning(f"Discarding unfinished export of run {previous_run}")
+
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM phases WHERE name = ? AND run != ?", (self._name, run))
+            connection.executemany(
+                "INSERT OR REPLACE INTO phases VALUES (?, ?, ?, ?, ?, ?, NULL)",
+                [(self._name, run, phase, position, step, json.dumps(requests, ensure_ascii=False))
+                 for position, (step, requests) in enumerate(steps)],
+            )
+
+        return [(position, step, requests) for position, (step, requests) in enumerate(steps)]
+
+    def complete(self, run: str, phase: str, position: int) -> None:
+        self._execute(
+            "UPDATE phases SET completed_at = ? WHERE name = ? AND run = ? AND phase = ? AND position = ?",
+            (time.time(), self._name, run, phase, position),
+        )
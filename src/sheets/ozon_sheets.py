@@ -1,27 +1,32 @@
+import os
 from datetime import datetime
 from itertools import zip_longest
 
-from gspread.utils import ValueInputOption
 from oauth2client.service_account import ServiceAccountCredentials
 
-from src.models import Status, OzonItemPair, OzonUrls
+from src.models import ItemBatch, OzonUrls
 from src.sheets import Sheets
+from src.sheets.rows import OzonRow, build_ozon_rows
 from src.utils import logger
 
 
 class OzonSheets(Sheets):
     WORKBOOK_NAME = "Трекер Ozon"
+    WORKBOOKS = os.getenv("OZON_WORKBOOKS", WORKBOOK_NAME)
+    RUN_COLUMNS = 4
+    RETAINED_RUNS = int(os.getenv("OZON_RETAINED_RUNS", 0))
     TOP_OFFSET_CELL_VALUE = "FBS"
 
-    def __init__(self, credentials: ServiceAccountCredentials):
-        super().__init__(credentials, self.WORKBOOK_NAME, self.TOP_OFFSET_CELL_VALUE)
+    def __init__(self, credentials: ServiceAccountCredentials,
+                 workbook_name: str = WORKBOOK_NAME, worksheet_name: str | None = None):
+        super().__init__(credentials, workbook_name, self.TOP_OFFSET_CELL_VALUE, worksheet_name)
         self._top_offset += 1
 
     def get_urls(self, skip_empty: bool = True) -> OzonUrls:
         logger.info("Getting urls...")
 
-        fbs_urls = self._sheet.col_values(1)[(self._top_offset + 1):]
-        fbo_urls = self._sheet.col_values(2)[(self._top_offset + 1):]
+        fbs_urls = self._snapshot_col(1)[(self._top_offset + 1):]
+        fbo_urls = self._snapshot_col(2)[(self._top_offset + 1):]
         urls = zip_longest(fbs_urls, fbo_urls, fillvalue="")
 
         if skip_empty:
@@ -29,109 +34,45 @@ class OzonSheets(Sheets):
 
         return OzonUrls(list(urls))
 
-    def set_items(self, items: list[OzonItemPair]):
-        fbs_quantities: list[str | int] = ([""] * (self._top_offset - 1) +
-                                           [datetime.now().strftime("%d/%m - %H:%M"), "FBS"])
-        fbo_quantities: list[str | int] = [""] * self._top_offset + ["FBO"]
-        fbs_prices: list[str | int] = [""] * self._top_offset + ["Цена FBS"]
-        fbo_prices: list[str | int] = [""] * self._top_offset + ["Цена FBO"]
-        fbs_green_prices = [False] * (self._top_offset + 1)
-        fbo_green_prices = [False] * (self._top_offset + 1)
-
-        urls = self.get_urls(skip_empty=False)
-        for urls_tuple in urls:
-            added = False
-
-            for item in items:
-                try:
-                    if (item.fbs and item.fbs.url != urls_tuple[0]) or (item.fbo and item.fbo.url != urls_tuple[1]):
-                        continue
-
-                    if (item.fbs and item.fbs.status == Status.OUT_OF_STOCK) and (item.fbo and item.fbo.status == Status.OUT_OF_STOCK):
-                        fbs_quantities.append(str(item.fbs.status.value))
-                        fbo_quantities.append("")
-                        fbs_prices.append("")
-                        fbo_prices.append("")
-                        fbs_green_prices.append(False)
-                        fbo_green_prices.append(False)
-                        added = True
-                        break
-
-                    if item.fbs:
-                        if item.fbs.status in (Status.OK, Status.OUT_OF_STOCK):
-                            fbs_quantities.append(item.fbs.quantity)
-                            if item.fbs.status == Status.OK:
-                                fbs_prices.append(str(item.fbs.green_price if item.fbs.green_price else item.fbs.price))
-                                fbs_green_prices.append(True if item.fbs.green_price else False)
-                            else:
-                                fbs_prices.append("")
-                                fbs_green_prices.append(False)
-                        else:
-                            fbs_quantities.append(str(item.fbs.status.value))
-                            fbs_prices.append("")
-                            fbs_green_prices.append(False)
-                    else:
-                        fbs_quantities.append("")
-                        fbs_prices.append("")
-                        fbs_green_prices.append(False)
-
-                    if item.fbo:
-                        if item.fbo.status in (Status.OK, Status.OUT_OF_STOCK):
-                            fbo_quantities.append(item.fbo.quantity)
-                            if item.fbo.status == Status.OK:
-                                fbo_prices.append(str(item.fbo.green_price if item.fbo.green_price else item.fbo.price))
-                                fbo_green_prices.append(True if item.fbo.green_price else False)
-                            else:
-                                fbo_prices.append("")
-                                fbo_green_prices.append(False)
-                        else:
-                            fbo_quantities.append(str(item.fbo.status.value))
-                            fbo_prices.append("")
-                            fbo_green_prices.append(False)
-                    else:
-                        fbo_quantities.append("")
-                        fbo_prices.append("")
-                        fbo_green_prices.append(False)
-
-                    added = True
-                    break
-                except Exception as e:
-                    logger.error(f"Error while adding item to sheet: {e}")
-                    continue
-
-            if not added:
-                fbs_quantities.append("")
-                fbo_quantities.append("")
-                fbs_prices.append("")
-                fbo_prices.append("")
-                fbs_green_prices.append(False)
-                fbo_green_prices.append(False)
-
-        fbs_quantities = list(map(str, fbs_quantities))
-        fbo_quantities = list(map(str, fbo_quantities))
-        fbs_prices = list(map(str, fbs_prices))
-        fbo_prices = list(map(str, fbo_prices))
+    def _build_rows(self, urls: list[tuple[str, str]], items: ItemBatch) -> list[OzonRow]:
+        return build_ozon_rows(OzonUrls(urls), items)
+
+    def _queue_begin(self, run_at: datetime, rows_count: int) -> None:
+        fbs_quantities: list[str] = ([""] * (self._top_offset - 1) +
+                                     [run_at.strftime("%d/%m - %H:%M"), "FBS"])
+        fbo_quantities: list[str] = [""] * self._top_offset + ["FBO"]
+        fbs_prices: list[str] = [""] * self._top_offset + ["Цена FBS"]
+        fbo_prices: list[str] = [""] * self._top_offset + ["Цена FBO"]
 
         # logger.debug("Removing previous colors...")
-        # self._remove_formatting(f"E3:H{len(urls) + self._top_offset + 1}")
+        # self._remove_formatting(f"E3:H{rows_count + self._top_offset + 1}")
+
+        logger.debug("Inserting header...")
+        self._batch.step("insert")
+        self._batch.insert_cols([fbs_quantities, fbo_quantities, fbs_prices, fbo_prices], col=7)
 
-        logger.debug("Inserting data...")
-        self._sheet.insert_cols([fbs_quantities, fbo_quantities, fbs_prices, fbo_prices],
-                                col=7, value_input_option=ValueInputOption.user_entered)
+        logger.debug("Archiving old runs...")
+        self._batch.step("archive")
+        self._archive_old_runs()
 
         logger.debug("Adding borders...")
-        self._add_border(f"G1:J{len(urls) + self._top_offset + 1}")
+        self._batch.step("borders")
+        self._add_border(f"G1:J{rows_count + self._top_offset + 1}")
 
         logger.debug("Formatting numbers...")
-        self._format_cells(f"G3:J{len(urls) + self._top_offset + 1}")
+        self._batch.step("number_formats")
+        self._format_cells(f"G3:J{rows_count + self._top_offset + 1}")
+
+    def _queue_rows(self, row: int, rows: list[OzonRow]) -> None:
+        fbs_quantities, fbo_quantities, fbs_prices, fbo_prices, fbs_green_prices, fbo_green_prices = \
+            map(list, zip(*rows))
 
-        # logger.debug("Coloring red cells...")
-        # self._color_red_cells(f"G3:G{len(urls) + self._top_offset + 1}", restrictions_col=4, prices_col=7)
-        # self._color_red_cells(f"H3:H{len(urls) + self._top_offset + 1}", restrictions_col=4, prices_col=8)
+        self._batch.update_cells([fbs_quantities, fbo_quantities, fbs_prices, fbo_prices], row=row, col=7)
 
-        logger.debug("Coloring green cells...")
-        self._color_green_cells(f"I3:I{len(urls) + 1}", fbs_green_prices)
-        self._color_green_cells(f"J3:J{len(urls) + 1}", fbo_green_prices)
+        self._color_price_cells("I", row, fbs_prices, restrictions_col=4, green_prices=fbs_green_prices)
+        self._color_price_cells("J", row, fbo_prices, restrictions_col=4, green_prices=fbo_green_prices)
 
+    def _queue_finish(self) -> None:
         logger.debug("Merging cells...")
-        self._sheet.merge_cells("G1:J1")
+        self._batch.step("merge")
+        self._batch.merge_cells("G1:J1")
@@ -0,0 +1,11 @@
+from typing import Sequence
+
+from src.models import Violation
+
+
+def find_violations(values: Sequence[str], restrictions: Sequence[int]) -> list[int]:
+    # One pass over a column, cells that are not plain numbers, like statuses, never violate
+    return [
+        i for i, (value, restriction) in enumerate(zip(values, restrictions))
+        if restriction and value.isdigit() and int(value) < restriction
+    ]
@@ -0,0 +1,78 @@
+from src.models import ItemBatch, Status, OzonUrls, WildberriesItem, WildberriesUrls
+from src.utils import logger
+
+OzonRow = tuple[str, str, str, str, bool, bool]
+WildberriesRow = tuple[str, str, str]
+
+_EMPTY_OZON_ROW: OzonRow = ("", "", "", "", False, False)
+_EMPTY_WILDBERRIES_ROW: WildberriesRow = ("", "", "")
+
+
+def _find_ozon_position(items: ItemBatch, urls_tuple: tuple[str, str]) -> int | None:
+    # A missing side of a pair matches any url, so the earliest of the candidates wins
+    fbs_url, fbo_url = urls_tuple
+    candidates = [items.position(key) for key in ((fbs_url, fbo_url), ("", fbo_url), (fbs_url, ""))]
+    candidates = [i for i in candidates if i is not None]
+    return min(candidates) if candidates else None
+
+
+def _ozon_cells(items: ItemBatch, index: int) -> tuple[str, str, bool]:
+    status = items.status(index)
+    if status is None:
+        return "", "", False
+
+    if status not in (Status.OK, Status.OUT_OF_STOCK):
+        return str(status.value), "", False
+
+    if status == Status.OUT_OF_STOCK:
+        return str(items.quantities[index]), "", False
+
+    green_price = items.green_prices[index]
+    return str(items.quantities[index]), str(green_price if green_price else items.prices[index]), bool(green_price)
+
+
+def build_ozon_rows(urls: OzonUrls, items: ItemBatch) -> list[OzonRow]:
+    rows = []
+    for urls_tuple in urls:
+        position = _find_ozon_position(items, urls_tuple)
+        if position is None:
+            rows.append(_EMPTY_OZON_ROW)
+            continue
+
+        fbs, fbo = items.index(position, 0), items.index(position, 1)
+        fbs_status, fbo_status = items.status(fbs), items.status(fbo)
+        if fbs_status is None and fbo_status is None:
+            rows.append(_EMPTY_OZON_ROW)
+            continue
+
+        try:
+            if fbs_status == Status.OUT_OF_STOCK and fbo_status == Status.OUT_OF_STOCK:
+                rows.append((str(fbs_status.value), "", "", "", False, False))
+                continue
+
+            fbs_quantity, fbs_price, fbs_green_price = _ozon_cells(items, fbs)
+            fbo_quantity, fbo_price, fbo_green_price = _ozon_cells(items, fbo)
+            rows.append((fbs_quantity, fbo_quantity, fbs_price, fbo_price, fbs_green_price, fbo_green_price))
+        except Exception as e:
+            logger.error(f"Error while adding item to sheet: {e}")
+            rows.append(_EMPTY_OZON_ROW)
+
+    return rows
+
+
+def build_wildberries_rows(urls: WildberriesUrls, items: ItemBatch) -> list[WildberriesRow]:
+    rows = []
+    for url in urls:
+        position = items.position(url)
+        status = items.status(items.index(position)) if position is not None else None
+
+        if status is None:
+            rows.append(_EMPTY_WILDBERRIES_ROW)
+        elif status == Status.OK:
+            index = items.index(position)
+            rows.append((str(items.quantities[index]), str(items.prices[index]),
+                         WildberriesItem.get_sale_formula(items.prices[index], items.no_sale_prices[index])))
+        else:
+            rows.append((str(status.value), "", ""))
+
+    return rows
@@ -1,147 +1,315 @@
+import math
 import re
+import threading
+from array import array
 from abc import ABC, abstractmethod
-from time import sleep
+from datetime import datetime
+from typing import Callable
 
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 
-from src.models import Item, Urls
+from src.models import Item, ItemBatch, Urls
 from src.sheets import CellFormat
-from src.utils import logger
+from src.sheets.batch_update import BatchUpdate
+from src.sheets.export_journal import ExportJournal
+from src.sheets.restrictions import Violation, find_violations
+from src.storage.serialization import dump_run, load_run
+from src.utils import logger, get_rate_limiter, track_request
+
+
+_clients: dict[int, gspread.Client] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(credentials: ServiceAccountCredentials) -> gspread.Client:
+    # Sheets opened with the same credentials share one client and its access token
+    with _clients_lock:
+        if id(credentials) not in _clients:
+            _clients[id(credentials)] = gspread.authorize(credentials)
+        return _clients[id(credentials)]
 
 
 class Sheets(ABC):
+    RUN_COL = 7
+    RUN_COLUMNS = 1
+    RETAINED_RUNS = 0
+    ARCHIVE_SHEET_NAME = "Архив"
+    SNAPSHOT_RANGE = "A:D"
+
+    _RED_TEXT = {
+        "foregroundColor": {"red": 0.8},
+        "bold": True,
+    }
+    _GREEN_TEXT = {
+        "foregroundColor": {"red": 0.41, "green": 0.67, "blue": 0.31},
+        "bold": False,
+    }
+    _DEFAULT_TEXT = {
+        "foregroundColor": {},
+        "bold": False,
+    }
+    WORKBOOK_NAME: str
+    WORKBOOKS: str
+
     def __init__(self,
                  credentials: ServiceAccountCredentials,
                  workbook_name: str,
-                 top_offset_cell_value: str
+                 top_offset_cell_value: str,
+                 worksheet_name: str | None = None,
                  ) -> None:
-        self._client = gspread.authorize(credentials)
-        self._workbook = self._client.open(workbook_name)
+        self._limiter = get_rate_limiter("sheets.googleapis.com")
+        self._client = get_client(credentials)
+        self._workbook = self._limiter.call(lambda: self._client.open(workbook_name))
         self._top_offset_cell_value = top_offset_cell_value
 
-        self._sheet = self._workbook.sheet1
+        if worksheet_name:
+            self.name = f"{workbook_name}:{worksheet_name}"
+            self._sheet = self._limiter.call(lambda: self._workbook.worksheet(worksheet_name))
+            self._archive_sheet_name = f"{self.ARCHIVE_SHEET_NAME} {worksheet_name}"
+        else:
+            self.name = workbook_name
+            self._sheet = self._workbook.sheet1
+            self._archive_sheet_name = self.ARCHIVE_SHEET_NAME
+
+        self._journal = ExportJournal(self.name)
+        self._batch = BatchUpdate(self._sheet)
+
+        self._snapshot: list[list[str]] | None = None
+        self._snapshot_header: list[str] | None = None
+        self._restrictions: dict[int, array] = {}
+        self._top_offset: int | None = None
         self._top_offset = self._get_top_offset()
 
+        self._url_rows: dict[str | tuple[str, str], list[int]] = {}
+        self._row_urls: dict[int, str | tuple[str, str]] = {}
+        self._run_at: datetime | None = None
+        self.violations: list[Violation] = []
+
+    def _row_values(self, row: int) -> list[str]:
+        return self._limiter.call(lambda: track_request("sheets_values_get", lambda: self._sheet.row_values(row)))
+
+    def _get_snapshot(self) -> list[list[str]]:
+        # The columns a run reads come from one request and stay valid until its export is finished,
+        # as the run itself only writes to the columns after them
+        if self._snapshot is None:
+            logger.debug("Reading sheet snapshot...")
+            ranges = [self.SNAPSHOT_RANGE]
+            if self.RETAINED_RUNS and self._top_offset is not None:
+                ranges.append(f"{self._top_offset + 1}:{self._top_offset + 1}")
+
+            value_ranges = self._limiter.call(lambda: track_request(
+                "sheets_values_batch_get",
+                lambda: self._sheet.batch_get(ranges, major_dimension="COLUMNS"),
+            ))
+            self._snapshot = list(value_ranges[0])
+            if len(ranges) > 1:
+                self._snapshot_header = [col[0] if col else "" for col in value_ranges[1]]
+        return self._snapshot
+
+    def _snapshot_col(self, col: int) -> list[str]:
+        snapshot = self._get_snapshot()
+        return list(snapshot[col - 1]) if col <= len(snapshot) else []
+
+    def _get_header(self) -> list[str]:
+        # The first snapshot is read before the top offset is known, so it has no header
+        self._get_snapshot()
+        if self._snapshot_header is None:
+            return self._row_values(self._top_offset + 1)
+        return self._snapshot_header
+
+    def invalidate_snapshot(self) -> None:
+        self._snapshot = None
+        self._snapshot_header = None
+        self._restrictions = {}
+
     def _get_top_offset(self) -> int:
         logger.info("Getting top offset...")
-        return self._sheet.col_values(1).index(self._top_offset_cell_value)
+        return self._snapshot_col(1).index(self._top_offset_cell_value)
+
+    @classmethod
+    def get_targets(cls) -> list[tuple[str, str | None]]:
+        # Comma separated workbooks, each may name its worksheet after a colon
+        targets = []
+        for target in cls.WORKBOOKS.split(","):
+            workbook_name, _, worksheet_name = target.strip().partition(":")
+            if workbook_name:
+                targets.append((workbook_name.strip(), worksheet_name.strip() or None))
+        return list(dict.fromkeys(targets)) or [(cls.WORKBOOK_NAME, None)]
 
     @abstractmethod
     def get_urls(self) -> Urls:
         pass
 
     @abstractmethod
-    def set_items(self, items: list[Item]):
+    def _build_rows(self, urls: list[str | tuple[str, str]], items: ItemBatch) -> list[tuple]:
         pass
 
+    @abstractmethod
+    def _queue_begin(self, run_at: datetime, rows_count: int) -> None:
+        pass
+
+    @abstractmethod
+    def _queue_rows(self, row: int, rows: list[tuple]) -> None:
+        pass
+
+    @abstractmethod
+    def _queue_finish(self) -> None:
+        pass
+
+    def get_unfinished_run(self) -> datetime | None:
+        run = self._journal.get_unfinished_run()
+        return load_run(run) if run else None
+
+    def _export_phase(self, run_at: datetime, phase: str, queue: Callable[[], None]) -> None:
+        run = dump_run(run_at)
+
+        # Steps are planned once per run, a retry only sends the ones that have not gone through
+        steps = self._journal.get_pending(run, phase)
+        if steps is None:
+            self._batch.clear()
+            queue()
+            steps = self._journal.plan(run, phase, self._batch.get_chunks())
+            self._batch.clear()
+        elif steps:
+            logger.info(f"Resuming {phase} of run {run}, {len(steps)} steps left")
+
+        # Steps like inserting columns apply twice when resent, so only a throttled step is sent again right away
+        for position, step, requests in steps:
+            logger.debug(f"Sending {step}...")
+            self._batch.send(requests, idempotent=False)
+            self._journal.complete(run, phase, position)
+
+    def begin_export(self, run_at: datetime) -> None:
+        urls = self.get_urls(skip_empty=False)
+
+        self._url_rows = {}
+        self._row_urls = {}
+        for i, url in enumerate(urls):
+            self._url_rows.setdefault(url, []).append(self._top_offset + 2 + i)
+            self._row_urls[self._top_offset + 2 + i] = url
+
+        # A retry of the same run keeps the violations found in the rows it already exported
+        if run_at != self._run_at:
+            self._run_at = run_at
+            self.violations = []
+
+        self._export_phase(run_at, "begin", lambda: self._queue_begin(run_at, len(urls)))
+
+    def write_items(self, items: ItemBatch) -> None:
+        urls = list(items)
+        rows = {}
+        for url, row in zip(urls, self._build_rows(urls, items)):
+            for index in self._url_rows.get(url, []):
+                rows[index] = row
+        self._write_rows(rows)
+
+    def finish_export(self, run_at: datetime) -> None:
+        self._export_phase(run_at, ExportJournal.LAST_PHASE, self._queue_finish)
+        self.invalidate_snapshot()
+
+    def set_items(self, items: ItemBatch | list[Item], run_at: datetime | None = None) -> None:
+        if not isinstance(items, ItemBatch):
+            items = ItemBatch.from_items(items)
+        run_at = run_at or datetime.now()
+        self.begin_export(run_at)
+
+        urls = list(self.get_urls(skip_empty=False))
+        self._write_rows({self._top_offset + 2 + i: row for i, row in enumerate(self._build_rows(urls, items))})
+
+        self.finish_export(run_at)
+
+    def _write_rows(self, rows: dict[int, tuple]) -> None:
+        indices = sorted(index for index, row in rows.items() if any(row))
+        if not indices:
+            return
+
+        # Rows that follow each other go out as one block
+        self._batch.clear()
+        start = 0
+        for i in range(1, len(indices) + 1):
+            if i == len(indices) or indices[i] != indices[i - 1] + 1:
+                self._queue_rows(indices[start], [rows[index] for index in indices[start:i]])
+                start = i
+
+        logger.debug(f"Writing {len(indices)} rows...")
+        self._batch.execute()
+
+    def _get_archive_sheet(self) -> gspread.Worksheet:
+        try:
+            archive = self._workbook.worksheet(self._archive_sheet_name)
+        except gspread.WorksheetNotFound:
+            logger.info("Creating archive sheet...")
+            archive = self._workbook.add_worksheet(self._archive_sheet_name, rows=self._sheet.row_count, cols=1)
+
+        if archive.row_count < self._sheet.row_count:
+            archive.add_rows(self._sheet.row_count - archive.row_count)
+
+        return archive
+
+    def _archive_old_runs(self) -> None:
+        if not self.RETAINED_RUNS:
+            return
+
+        # Every run writes its header row, the one being inserted is not there yet
+        header = self._get_header()
+        runs = math.ceil(max(len(header) - self.RUN_COL + 1, 0) / self.RUN_COLUMNS) + 1
+        if runs <= self.RETAINED_RUNS:
+            return
+
+        logger.debug(f"Archiving {runs - self.RETAINED_RUNS} runs...")
+        archive = self._get_archive_sheet()
+        self._batch.move_cols(archive,
+                              col=self.RUN_COL + self.RETAINED_RUNS * self.RUN_COLUMNS,
+                              count=(runs - self.RETAINED_RUNS) * self.RUN_COLUMNS,
+                              target_col=self._get_archive_end(archive) + 1)
+
+    def _get_archive_end(self, archive: gspread.Worksheet) -> int:
+        # The archive holds whole runs from its first column on, the oldest first.
+        # Its header row is the one of the sheet, as the runs are moved with their rows.
+        header = self._limiter.call(lambda: track_request(
+            "sheets_values_get", lambda: archive.row_values(self._top_offset + 1)
+        ))
+        return math.ceil(len(header) / self.RUN_COLUMNS) * self.RUN_COLUMNS
+
     def _add_border(self, cells_range: str) -> None:
-        first, second = cells_range.split(":")
-        left, top, right, bottom = first[0], first[1:], second[0], second[1:]
-        border = {"style": "SOLID"}
-
-        # Edges
-        self._sheet.format(f"{left}{top}:{right}{top}", {"borders": {"top": border}})
-        self._sheet.format(f"{left}{top}:{left}{bottom}", {"borders": {"left": border}})
-        self._sheet.format(f"{left}{bottom}:{right}{bottom}", {"borders": {"bottom": border}})
-        self._sheet.format(f"{right}{top}:{right}{bottom}", {"borders": {"right": border}})
-        sleep(1)
-
-        # Corners
-        self._sheet.format(left + top, {"borders": {"left": border, "top": border}})
-        self._sheet.format(right + top, {"borders": {"right": border, "top": border}})
-        self._sheet.format(left + bottom, {"borders": {"left": border, "bottom": border}})
-        self._sheet.format(right + bottom, {"borders": {"right": border, "bottom": border}})
-        sleep(1)
+        self._batch.add_border(cells_range, {"style": "SOLID"})
 
     def _format_cells(self, cells_range: str, cell_format: CellFormat = CellFormat.NUMBER_WITH_SPACE) -> None:
-        # Edges
-        self._sheet.format(cells_range, cell_format.value)
-        sleep(1)
+        self._batch.format(cells_range, cell_format.value)
 
     @staticmethod
     def _number_literal_to_int(number_literal: str) -> int:
         return int(re.sub(r"\D", "", number_literal))
 
-    def _get_restrictions(self, restrictions_col: int) -> list[int]:
-        logger.debug("Getting restrictions...")
-        return list(map(
-            lambda n: self._number_literal_to_int(n) if n else 0,
-            self._sheet.col_values(restrictions_col)[(self._top_offset + 1):]
-        ))
+    def _get_restrictions(self, restrictions_col: int) -> array:
+        if restrictions_col not in self._restrictions:
+            logger.debug("Getting restrictions...")
+            self._restrictions[restrictions_col] = array("q", (
+                self._number_literal_to_int(n) if any(c.isdigit() for c in n) else 0
+                for n in self._snapshot_col(restrictions_col)[(self._top_offset + 1):]
+            ))
+        return self._restrictions[restrictions_col]
+
+    def _color_price_cells(self, col: str, row: int, prices: list[str], restrictions_col: int | None = None,
+                           green_prices: list[bool] | None = None) -> None:
+        violations = []
+        if restrictions_col is not None:
+            start = row - self._top_offset - 2
+            restrictions = self._get_restrictions(restrictions_col)[start:start + len(prices)]
+            violations = find_violations(prices, restrictions)
+            self.violations.extend(
+                Violation(self.name, self._row_urls.get(row + i), f"{col}{row + i}", int(prices[i]), restrictions[i])
+                for i in violations
+            )
 
-    def _color_red_cells(self, cells_range: str, restrictions_col: int, prices_col: int) -> None:
-        restrictions = self._get_restrictions(restrictions_col)
-
-        first, second = cells_range.split(":")
-        left, top, right, _ = first[0], int(first[1:]), second[0], second[1:]
-
-        prices = self._sheet.col_values(prices_col)[(self._top_offset + 1):]
-        for i, price in enumerate(prices):
-            if i >= len(restrictions):
-                break
-
-            if not price:
-                continue
-
-            price = self._number_literal_to_int(price)
-            if price < restrictions[i]:
-                self._sheet.format(f"{left}{i + top}:{right}{i + top}",
-                                   {
-                                       "textFormat":
-                                           {
-                                               "foregroundColor":
-                                                   {
-                                                       "red": 0.8
-                                                   },
-                                               "bold": True
-                                           },
-                                   })
-                sleep(1)
-
-    def _color_green_cells(self, cells_range: str, green_prices: list[bool]) -> None:
-        first, second = cells_range.split(":")
-        left, top, right, _ = first[0], int(first[1:]) - self._top_offset - 1, second[0], second[1:]
-
-        for i, green_price in enumerate(green_prices):
-            if not green_price:
-                continue
-
-            self._sheet.format(f"{left}{i + top}:{right}{i + top}",
-                               # {
-                               #     "backgroundColor":
-                               #         {
-                               #             "red": 0.85,
-                               #             "green": 0.91,
-                               #             "blue": 0.82
-                               #         }
-                               # },
-                               {
-                                   "textFormat":
-                                       {
-                                           "foregroundColor":
-                                               {
-                                                   "red": 0.41,
-                                                   "green": 0.67,
-                                                   "blue": 0.31
-                                               },
-                                       },
-                               }
-                               )
-            sleep(1)
+        # The whole block goes out as one request, which also clears the colors of the cells that are fine now
+        red = set(violations)
+        green_prices = green_prices or [False] * len(prices)
+        self._batch.update_formats([
+            {"textFormat": self._RED_TEXT if i in red else self._GREEN_TEXT if green_prices[i] else self._DEFAULT_TEXT}
+            for i in range(len(prices))
+        ], row=row, col=gspread.utils.a1_to_rowcol(f"{col}1")[1])
 
     def _remove_formatting(self, cells_range: str) -> None:
-        self._sheet.format(cells_range,
-                           {
-                               "textFormat":
-                                   {
-                                       "foregroundColor": {},
-                                       "bold": False
-                                   },
-                               # "backgroundColor": {
-                               #     "red": 1,
-                               #     "green": 1,
-                               #     "blue": 1
-                               # }
-                           })
-        sleep(1)
+        self._batch.format(cells_range, {"textFormat": self._DEFAULT_TEXT})
@@ -1,72 +1,67 @@
+import os
 from datetime import datetime
 from typing import List
 
-from gspread.utils import ValueInputOption
 from oauth2client.service_account import ServiceAccountCredentials
 
-from src.models import Status, WildberriesItem, WildberriesUrls
+from src.models import ItemBatch, WildberriesUrls
 from src.sheets import Sheets, CellFormat
+from src.sheets.rows import WildberriesRow, build_wildberries_rows
 from src.utils import logger
 
 
 class WildberriesSheets(Sheets):
     WORKBOOK_NAME = "Трекер Wildberries"
+    WORKBOOKS = os.getenv("WILDBERRIES_WORKBOOKS", WORKBOOK_NAME)
+    RUN_COLUMNS = 3
+    RETAINED_RUNS = int(os.getenv("WILDBERRIES_RETAINED_RUNS", 0))
     TOP_OFFSET_CELL_VALUE = "Ссылка"
 
-    def __init__(self, credentials: ServiceAccountCredentials):
-        super().__init__(credentials, self.WORKBOOK_NAME, self.TOP_OFFSET_CELL_VALUE)
+    def __init__(self, credentials: ServiceAccountCredentials,
+                 workbook_name: str = WORKBOOK_NAME, worksheet_name: str | None = None):
+        super().__init__(credentials, workbook_name, self.TOP_OFFSET_CELL_VALUE, worksheet_name)
 
     def get_urls(self, skip_empty: bool = True) -> WildberriesUrls:
         logger.info("Getting urls...")
-        urls = self._sheet.col_values(1)[(self._top_offset + 1):]
+        urls = self._snapshot_col(1)[(self._top_offset + 1):]
         if skip_empty:
             urls = list(filter(lambda url: url != "", urls))
         return WildberriesUrls(urls)
 
-    def set_items(self, items: List[WildberriesItem]):
-        quantities = [""] * self._top_offset + [datetime.now().strftime("%d/%m - %H:%M")]
-        prices = [""] * (self._top_offset + 1)
-        sales = [""] * (self._top_offset + 1)
-
-        urls = self.get_urls(skip_empty=False)
-        for url in urls:
-            added = False
-
-            for item in items:
-                if item.url != url:
-                    continue
-
-                if item.status == Status.OK:
-                    quantities.append(str(item.quantity))
-                    prices.append(str(item.sale_price))
-                    sales.append(item.sale_formula)
-                else:
-                    quantities.append(str(item.status.value))
-                    prices.append("")
-                    sales.append("")
-                added = True
-                break
-
-            if not added:
-                quantities.append("")
-                prices.append("")
-                sales.append("")
+    def _build_rows(self, urls: List[str], items: ItemBatch) -> List[WildberriesRow]:
+        return build_wildberries_rows(WildberriesUrls(urls), items)
+
+    def _queue_begin(self, run_at: datetime, rows_count: int) -> None:
+        header = [""] * self._top_offset + [run_at.strftime("%d/%m - %H:%M")]
 
         logger.debug("Removing previous colors...")
-        self._remove_formatting(f"H2:H{len(urls) + 1}")
+        self._batch.step("remove_formatting")
+        self._remove_formatting(f"H2:H{rows_count + 1}")
+
+        logger.debug("Inserting header...")
+        self._batch.step("insert")
+        self._batch.insert_cols([header, [], []], col=7)
 
-        logger.debug("Inserting data...")
-        self._sheet.insert_cols([quantities, prices, sales], col=7, value_input_option=ValueInputOption.user_entered)
+        logger.debug("Archiving old runs...")
+        self._batch.step("archive")
+        self._archive_old_runs()
 
         logger.debug("Adding borders...")
-        self._add_border(f"G1:I{len(urls) + 1}")
+        self._batch.step("borders")
+        self._add_border(f"G1:I{rows_count + 1}")
 
         logger.debug("Formatting numbers...")
-        self._format_cells(f"G2:H{len(urls) + 1}", CellFormat.NUMBER_WITH_SPACE)
-        self._format_cells(f"I2:I{len(urls) + 1}", CellFormat.NUMBER_PERCENT)
+        self._batch.step("number_formats")
+        self._format_cells(f"G2:H{rows_count + 1}", CellFormat.NUMBER_WITH_SPACE)
+        self._format_cells(f"I2:I{rows_count + 1}", CellFormat.NUMBER_PERCENT)
+
+    def _queue_rows(self, row: int, rows: List[WildberriesRow]) -> None:
+        quantities, prices, sales = map(list, zip(*rows))
 
-        logger.debug("Coloring red cells...")
-        self._color_red_cells(f"H2:H{len(urls) + 1}", restrictions_col=3, prices_col=8)
+        self._batch.update_cells([quantities, prices, sales], row=row, col=7)
+        self._color_price_cells("H", row, prices, restrictions_col=3)
 
+    def _queue_finish(self) -> None:
         logger.debug("Merging cells...")
-        self._sheet.merge_cells("G1:I1")
+        self._batch.step("merge")
+        self._batch.merge_cells("G1:I1")
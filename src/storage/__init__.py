@@ -0,0 +1,4 @@
+from .sqlite_store import SqliteStore
+from .history import HistoryRecord, HistoryStore
+from .checkpoint import Checkpoint
+from .work_queue import QueueLock, WorkQueue
@@ -0,0 +1,77 @@
+import json
+import os
+import time
+from datetime import datetime
+from typing import Iterable
+
+from src.models import Item, ItemBatch, OzonItemPair, Status
+from src.storage.serialization import dump_item, dump_run, dump_url, load_item, load_url
+from src.storage.sqlite_store import SqliteStore
+
+
+class Checkpoint(SqliteStore):
+    PATH = os.getenv("CHECKPOINT_PATH", "data/checkpoint.sqlite3")
+    WINDOW = int(os.getenv("CHECKPOINT_WINDOW", 6 * 60 * 60))
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS items (
+            name TEXT NOT NULL,
+            url TEXT NOT NULL,
+            item TEXT NOT NULL,
+            completed_at REAL NOT NULL,
+            PRIMARY KEY (name, url)
+        );
+        CREATE TABLE IF NOT EXISTS exported (
+            name TEXT NOT NULL,
+            target TEXT NOT NULL,
+            run TEXT NOT NULL,
+            url TEXT NOT NULL,
+            PRIMARY KEY (name, target, run, url)
+        );
+    """
+
+    def __init__(self, name: str, path: str | None = None) -> None:
+        super().__init__(path)
+        self._name = name
+
+    def load(self) -> ItemBatch:
+        rows = self._query(
+            "SELECT url, item FROM items WHERE name = ? AND completed_at > ?",
+            (self._name, time.time() - self.WINDOW),
+        )
+        return ItemBatch.from_results((load_url(key), load_item(json.loads(item))) for key, item in rows)
+
+    def save(self, url: str | tuple[str, str], item: Item | None) -> None:
+        # Failed items are left out so that a retry fetches them again
+        if item is None or self._has_errors(item):
+            return
+
+        self._execute(
+            "INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?)",
+            (self._name, dump_url(url), json.dumps(dump_item(item), ensure_ascii=False), time.time()),
+        )
+
+    def get_exported(self, target: str, run_at: datetime) -> set[str | tuple[str, str]]:
+        rows = self._query(
+            "SELECT url FROM exported WHERE name = ? AND target = ? AND run = ?",
+            (self._name, target, dump_run(run_at)),
+        )
+        return {load_url(key) for key, in rows}
+
+    def mark_exported(self, target: str, urls: Iterable[str | tuple[str, str]], run_at: datetime) -> None:
+        with self._transaction() as connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO exported VALUES (?, ?, ?, ?)",
+                [(self._name, target, dump_run(run_at), dump_url(url)) for url in urls],
+            )
+
+    def clear(self) -> None:
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM items WHERE name = ?", (self._name,))
+            connection.execute("DELETE FROM exported WHERE name = ?", (self._name,))
+
+    @staticmethod
+    def _has_errors(item: Item) -> bool:
+        if isinstance(item, OzonItemPair):
+            return any(ozon_item and ozon_item.status == Status.PARSING_ERROR for ozon_item in (item.fbs, item.fbo))
+        return item.status == Status.PARSING_ERROR
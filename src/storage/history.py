@@ -0,0 +1,111 @@
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable
+
+from src.models import OZON, WILDBERRIES, Item, OzonItem, OzonItemPair, Status, WildberriesItem
+from src.storage.sqlite_store import SqliteStore
+
+
+@dataclass
+class HistoryRecord:
+    taken_at: datetime
+    marketplace: str
+    item: OzonItem | WildberriesItem
+    fulfillment: str | None = None
+
+
+class HistoryStore(SqliteStore):
+    PATH = os.getenv("HISTORY_PATH", "data/history.sqlite3")
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS items (
+            marketplace TEXT NOT NULL,
+            taken_at REAL NOT NULL,
+            sku TEXT,
+            url TEXT,
+            fulfillment TEXT,
+            quantity INTEGER,
+            price INTEGER,
+            green_price INTEGER,
+            no_sale_price INTEGER,
+            status TEXT NOT NULL
+        );
+        DROP INDEX IF EXISTS items_sku_taken_at;
+        CREATE INDEX IF NOT EXISTS items_marketplace_sku_taken_at ON items (marketplace, sku, taken_at);
+        CREATE INDEX IF NOT EXISTS items_marketplace_taken_at ON items (marketplace, taken_at);
+        CREATE INDEX IF NOT EXISTS items_marketplace_url_taken_at ON items (marketplace, url, fulfillment, taken_at);
+    """
+    _COLUMNS = "marketplace, taken_at, sku, url, fulfillment, quantity, price, green_price, no_sale_price, status"
+
+    def add_items(self, marketplace: str, items: Iterable[Item], taken_at: datetime | None = None) -> None:
+        timestamp = (taken_at or datetime.now()).timestamp()
+
+        rows = []
+        for item in items:
+            if isinstance(item, OzonItemPair):
+                for fulfillment, ozon_item in (("FBS", item.fbs), ("FBO", item.fbo)):
+                    if ozon_item:
+                        rows.append(self._ozon_row(marketplace, timestamp, fulfillment, ozon_item))
+            elif isinstance(item, WildberriesItem):
+                rows.append(self._wildberries_row(marketplace, timestamp, item))
+
+        with self._transaction() as connection:
+            connection.executemany(f"INSERT INTO items ({self._COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def get_history(self, marketplace: str, sku: str | int,
+                    since: datetime | None = None,
+                    until: datetime | None = None) -> list[HistoryRecord]:
+        # Ozon and Wildberries skus are numbered independently, so the same sku may belong to both
+        rows = self._query(
+            f"SELECT {self._COLUMNS} FROM items "
+            f"WHERE marketplace = ? AND sku = ? AND taken_at >= ? AND taken_at <= ? ORDER BY taken_at",
+            (marketplace, str(sku),
+             since.timestamp() if since else float("-inf"),
+             until.timestamp() if until else float("inf")),
+        )
+        return list(map(self._to_record, rows))
+
+    def _get_latest(self, marketplace: str, since: float, until: float, limit: int) -> list[tuple]:
+        # The last records of every url and fulfillment, in the order they were taken
+        return self._query(
+            f"SELECT {self._COLUMNS} FROM ("
+            f"SELECT {self._COLUMNS}, rowid AS id, ROW_NUMBER() OVER "
+            f"(PARTITION BY url, fulfillment ORDER BY taken_at DESC, rowid DESC) AS n "
+            f"FROM items WHERE marketplace = ? AND taken_at >= ? AND taken_at <= ?"
+            f") WHERE n <= ? ORDER BY taken_at, id",
+            (marketplace, since, until, limit),
+        )
+
+    def get_recent(self, marketplace: str, since: datetime, limit: int) -> list[HistoryRecord]:
+        return list(map(self._to_record, self._get_latest(marketplace, since.timestamp(), float("inf"), limit)))
+
+    def get_snapshot(self, at: datetime, marketplace: str) -> list[HistoryRecord]:
+        # Items are polled at their own intervals, so the snapshot holds the last record of each of them
+        return list(map(self._to_record, self._get_latest(marketplace, float("-inf"), at.timestamp(), 1)))
+
+    @staticmethod
+    def _ozon_row(marketplace: str, timestamp: float, fulfillment: str, item: OzonItem) -> tuple:
+        _, sku = OZON.parser.extract_url_parts(item.url or "")
+        return (marketplace, timestamp, str(sku) if sku else None, item.url, fulfillment,
+                item.quantity, item.price, item.green_price, None, item.status.name)
+
+    @staticmethod
+    def _wildberries_row(marketplace: str, timestamp: float, item: WildberriesItem) -> tuple:
+        return (marketplace, timestamp, WILDBERRIES.parser.extract_code(item.url), item.url, None,
+                item.quantity, item.sale_price, None, item.no_sale_price, item.status.name)
+
+    @staticmethod
+    def _to_record(row: tuple) -> HistoryRecord:
+        (marketplace, taken_at, _, url, fulfillment,
+         quantity, price, green_price, no_sale_price, status) = row
+
+        # Only Ozon items are split by fulfillment
+        if fulfillment is None:
+            item = WildberriesItem(url=url, quantity=quantity, sale_price=price,
+                                   no_sale_price=no_sale_price, status=Status[status])
+        else:
+            item = OzonItem(url=url, quantity=quantity, price=price,
+                            status=Status[status], green_price=green_price)
+
+        return HistoryRecord(datetime.fromtimestamp(taken_at), marketplace, item, fulfillment)
@@ -0,0 +1,43 @@
+import json
+from dataclasses import asdict
+from datetime import datetime
+
+from src.models import Item, OzonItem, OzonItemPair, Status, WildberriesItem
+
+
+def dump_url(url: str | tuple[str, str]) -> str:
+    return json.dumps(url, ensure_ascii=False)
+
+
+def load_url(key: str) -> str | tuple[str, str]:
+    url = json.loads(key)
+    return tuple(url) if isinstance(url, list) else url
+
+
+def dump_run(run_at: datetime) -> str:
+    # Two exports started within the same second are still different runs
+    return run_at.isoformat(timespec="microseconds")
+
+
+def load_run(run: str) -> datetime:
+    return datetime.fromisoformat(run)
+
+
+def dump_item(item: Item) -> dict:
+    data = asdict(item)
+    if isinstance(item, OzonItemPair):
+        for side in ("fbs", "fbo"):
+            if data[side]:
+                data[side]["status"] = data[side]["status"].name
+    else:
+        data["status"] = data["status"].name
+    return data
+
+
+def load_item(data: dict) -> Item:
+    if "fbs" in data:
+        return OzonItemPair(**{
+            side: OzonItem(**{**data[side], "status": Status[data[side]["status"]]}) if data[side] else None
+            for side in ("fbs", "fbo")
+        })
+    return WildberriesItem(**{**data, "status": Status[data["status"]]})
@@ -0,0 +1,51 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+from threading import Lock
+from typing import Iterator
+
+
+class SqliteStore:
+    PATH: str
+    TIMEOUT = 30
+    WAL = False
+
+    _SCHEMA: str
+
+    def __init__(self, path: str | None = None) -> None:
+        path = path or self.PATH
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        # The connection is shared between threads and transactions are opened explicitly
+        self._lock = Lock()
+        self._connection = sqlite3.connect(path, timeout=self.TIMEOUT, isolation_level=None,
+                                           check_same_thread=False)
+        if self.WAL:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(self._SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def _execute(self, sql: str, parameters: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._connection.execute(sql, parameters)
+
+    def _query(self, sql: str, parameters: tuple = ()) -> list[tuple]:
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # Writers wait for each other from the start, so that what a transaction read is still there when it writes
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._connection
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
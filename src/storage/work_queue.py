@@ -0,0 +1,166 @@
+import json
+import os
+import time
+import uuid
+
+from src.parsing.item_parser import ItemResult
+from src.storage.serialization import dump_item, dump_url, load_item, load_url
+from src.storage.sqlite_store import SqliteStore
+from src.utils import logger
+
+
+class WorkQueue(SqliteStore):
+    PATH = os.getenv("WORK_QUEUE_PATH", "data/work_queue.sqlite3")
+    WAL = True
+    MAX_ATTEMPTS = int(os.getenv("SHARD_MAX_ATTEMPTS", 3))
+    RELEASE_DELAY = 30
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS shards (
+            name TEXT NOT NULL,
+            run TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            urls TEXT NOT NULL,
+            worker TEXT,
+            lease_until REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            results TEXT,
+            taken INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (name, run, position)
+        );
+        CREATE TABLE IF NOT EXISTS locks (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        );
+    """
+
+    def __init__(self, name: str, path: str | None = None) -> None:
+        # The coordinator and the workers are separate processes, a worker renews its lease from another thread
+        super().__init__(path)
+        self._name = name
+
+    def put(self, urls: list[str | tuple[str, str]], shard_size: int) -> str:
+        # Shards of earlier runs are dropped, their workers find out when they complete
+        run = uuid.uuid4().hex
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM shards WHERE name = ?", (self._name,))
+            connection.executemany(
+                "INSERT INTO shards (name, run, position, urls) VALUES (?, ?, ?, ?)",
+                [(self._name, run, position, json.dumps(list(map(dump_url, urls[i:i + shard_size]))))
+                 for position, i in enumerate(range(0, len(urls), shard_size))],
+            )
+        return run
+
+    def claim(self, worker: str, lease: float) -> tuple[str, int, list[str | tuple[str, str]]] | None:
+        # A shard is free until it has results, once its lease expired it goes to the next worker.
+        # A shard that used up its attempts is left for the coordinator to fail.
+        now = time.time()
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT run, position, urls, worker, attempts FROM shards "
+                "WHERE name = ? AND results IS NULL AND (lease_until IS NULL OR lease_until < ?) AND attempts < ? "
+                "ORDER BY position LIMIT 1",
+                (self._name, now, self.MAX_ATTEMPTS),
+            ).fetchone()
+            if row is not None:
+                connection.execute(
+                    "UPDATE shards SET worker = ?, lease_until = ?, attempts = attempts + 1 "
+                    "WHERE name = ? AND run = ? AND position = ?",
+                    (worker, now + lease, self._name, row[0], row[1]),
+                )
+
+        if row is None:
+            return None
+
+        run, position, urls, previous_worker, attempts = row
+        if previous_worker is not None:
+            logger.warning(f"Reassigning shard {position} from {previous_worker} after {attempts} attempts")
+        return run, position, list(map(load_url, json.loads(urls)))
+
+    def renew(self, run: str, position: int, worker: str, lease: float) -> bool:
+        cursor = self._execute(
+            "UPDATE shards SET lease_until = ? "
+            "WHERE name = ? AND run = ? AND position = ? AND worker = ? AND results IS NULL",
+            (time.time() + lease, self._name, run, position, worker),
+        )
+        return cursor.rowcount > 0
+
+    def release(self, run: str, position: int, worker: str) -> None:
+        # A shard that failed waits twice as long after every attempt before it can be claimed again
+        self._execute(
+            "UPDATE shards SET worker = NULL, lease_until = ? + ? * (1 << (attempts - 1)) "
+            "WHERE name = ? AND run = ? AND position = ? AND worker = ? AND results IS NULL",
+            (time.time(), self.RELEASE_DELAY, self._name, run, position, worker),
+        )
+
+    def complete(self, run: str, position: int, worker: str, results: list[ItemResult]) -> bool:
+        # Results of a worker that lost its lease are dropped, the shard belongs to another one by then
+        cursor = self._execute(
+            "UPDATE shards SET results = ?, lease_until = NULL "
+            "WHERE name = ? AND run = ? AND position = ? AND worker = ? AND results IS NULL",
+            (json.dumps([(dump_url(url), dump_item(item) if item is not None else None) for url, item in results],
+                        ensure_ascii=False),
+             self._name, run, position, worker),
+        )
+        return cursor.rowcount > 0
+
+    def take(self, run: str) -> tuple[list[ItemResult], int, list[int]]:
+        # Returns the results of the shards completed since the last call, the count of unfinished shards
+        # and the positions of the ones that failed every attempt
+        with self._transaction() as connection:
+            rows = connection.execute(
+                "SELECT position, results FROM shards "
+                "WHERE name = ? AND run = ? AND results IS NOT NULL AND taken = 0 ORDER BY position",
+                (self._name, run),
+            ).fetchall()
+            connection.executemany(
+                "UPDATE shards SET taken = 1 WHERE name = ? AND run = ? AND position = ?",
+                [(self._name, run, position) for position, _ in rows],
+            )
+            remaining, = connection.execute(
+                "SELECT COUNT(*) FROM shards WHERE name = ? AND run = ? AND results IS NULL",
+                (self._name, run),
+            ).fetchone()
+            failed = [position for position, in connection.execute(
+                "SELECT position FROM shards WHERE name = ? AND run = ? AND results IS NULL AND attempts >= ? "
+                "AND (worker IS NULL OR lease_until < ?) ORDER BY position",
+                (self._name, run, self.MAX_ATTEMPTS, time.time()),
+            )]
+
+        results = [(load_url(key), load_item(item) if item is not None else None)
+                   for _, shard_results in rows for key, item in json.loads(shard_results)]
+        return results, remaining, failed
+
+    def clear(self) -> None:
+        self._execute("DELETE FROM shards WHERE name = ?", (self._name,))
+
+    def acquire_lock(self, lock: str, holder: str, lease: float) -> bool:
+        # A lock expires after its lease, so that one held by a process that died is not held forever
+        now = time.time()
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM locks WHERE name = ? AND expires_at < ?", (lock, now))
+            cursor = connection.execute(
+                "INSERT INTO locks VALUES (?, ?, ?) ON CONFLICT (name) DO UPDATE SET expires_at = excluded.expires_at "
+                "WHERE holder = excluded.holder",
+                (lock, holder, now + lease),
+            )
+        return cursor.rowcount > 0
+
+    def release_lock(self, lock: str, holder: str) -> None:
+        self._execute("DELETE FROM locks WHERE name = ? AND holder = ?", (lock, holder))
+
+
+class QueueLock:
+    # A lock shared by every process that uses the queue's database
+    def __init__(self, queue: WorkQueue, name: str, holder: str, lease: float) -> None:
+        self._queue = queue
+        self._name = name
+        self._holder = holder
+        self._lease = lease
+
+    def acquire(self) -> bool:
+        return self._queue.acquire_lock(self._name, self._holder, self._lease)
+
+    def release(self) -> None:
+        self._queue.release_lock(self._name, self._holder)
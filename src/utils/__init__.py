@@ -1,2 +1,4 @@
 from .encoder import QuotEncoder
 from .logger import logger
+from .metrics import track_request, track_request_async, start_metrics_server
+from .rate_limiter import RateLimiter, get_rate_limiter, set_rate_limiter
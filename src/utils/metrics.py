@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Awaitable, Callable, Iterator, TypeVar
+
+from src.utils.logger import logger
+
+T = TypeVar("T")
+
+LabelsKey = tuple[tuple[str, str], ...]
+
+
+def _labels_key(labels: dict[str, object]) -> LabelsKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelsKey, extra: dict[str, str] | None = None) -> str:
+    pairs = list(key) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    TYPE = "counter"
+
+    def __init__(self, name: str, description: str) -> None:
+        self.name = name
+        self.description = description
+        self._lock = threading.Lock()
+        self._values: dict[LabelsKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _labels_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self) -> dict[LabelsKey, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> list[str]:
+        return [f"{self.name}{_format_labels(key)} {value:g}" for key, value in sorted(self.snapshot().items())]
+
+
+class Histogram:
+    TYPE = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: tuple[float, ...]) -> None:
+        self.name = name
+        self.description = description
+        self._buckets = buckets + (math.inf,)
+        self._lock = threading.Lock()
+        self._values: dict[LabelsKey, tuple[list[int], float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = _labels_key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * len(self._buckets), 0.0)
+            for i, bound in enumerate(self._buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict[LabelsKey, tuple[int, float]]:
+        with self._lock:
+            return {key: (counts[-1], total) for key, (counts, total) in self._values.items()}
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+
+        lines = []
+        for key, (counts, total) in sorted(values.items()):
+            for bound, count in zip(self._buckets, counts):
+                le = "+Inf" if bound == math.inf else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{_format_labels(key, {'le': le})} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total:g}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {counts[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: list[Counter | Histogram] = []
+
+    def counter(self, name: str, description: str) -> Counter:
+        metric = Counter(name, description)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, description: str, buckets: tuple[float, ...]) -> Histogram:
+        metric = Histogram(name, description, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.TYPE}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict[str, dict]:
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.counter("tracker_requests_total", "Requests sent, by endpoint and response status")
+REQUEST_SECONDS = REGISTRY.histogram("tracker_request_seconds", "Request latency, by endpoint",
+                                     (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+RETRIES = REGISTRY.counter("tracker_retries_total", "Failed or throttled requests that were backed off, by host")
+ITEMS = REGISTRY.counter("tracker_items_total", "Parsed items, by marketplace and status")
+STAGE_SECONDS = REGISTRY.histogram("tracker_stage_seconds", "Duration of update stages, by marketplace and stage",
+                                   (0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200))
+VIOLATIONS = REGISTRY.counter("tracker_restriction_violations_total", "Values below their restriction, by sheet")
+RUNS = REGISTRY.counter("tracker_runs_total", "Finished updates, by marketplace")
+
+
+def track_request(endpoint: str, request: Callable[[], T]) -> T:
+    start = time.perf_counter()
+    status = "error"
+    try:
+        result = request()
+        status = str(getattr(result, "status_code", "ok"))
+        return result
+    finally:
+        REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+        REQUESTS.inc(endpoint=endpoint, status=status)
+
+
+async def track_request_async(endpoint: str, request: Callable[[], Awaitable[T]]) -> T:
+    start = time.perf_counter()
+    status = "error"
+    try:
+        result = await request()
+        status = str(getattr(result, "status_code", "ok"))
+        return result
+    finally:
+        REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+        REQUESTS.inc(endpoint=endpoint, status=status)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        data = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_metrics_server(host: str | None = None, port: int | None = None) -> ThreadingHTTPServer | None:
+    host = host or os.getenv("METRICS_HOST", "127.0.0.1")
+    port = port if port is not None else int(os.getenv("METRICS_PORT", 9100))
+    if not port:
+        return None
+
+    # Another process on the host may serve its metrics there already, which is no reason to stop tracking
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logger.warning(f"Metrics are not served, {host}:{port} is unavailable: {e}")
+        return None
+
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
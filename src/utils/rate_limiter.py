@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, TypeVar
+
+from src.utils.logger import logger
+from src.utils.metrics import RETRIES
+
+T = TypeVar("T")
+
+
+class RateLimiter:
+    ATTEMPTS = 3
+    MIN_BACKOFF = 1
+    MAX_BACKOFF = 60
+
+    def __init__(self, host: str, rate: float, max_rate: float, min_rate: float = 0.1) -> None:
+        self.host = host
+        self.rate = rate
+        self._base_max_rate = max_rate
+        self._max_rate = max_rate
+        self._min_rate = min_rate
+
+        self._lock = threading.Lock()
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._backoff = self.MIN_BACKOFF
+
+    def scale(self, factor: int) -> None:
+        # Used when requests to the host are spread over several exits
+        with self._lock:
+            self._max_rate = self._base_max_rate * max(factor, 1)
+
+    def _reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            burst = max(1.0, self.rate)
+            self._tokens = min(burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+            # Tokens may go negative, which queues callers behind each other
+            self._tokens -= 1
+            return max(-self._tokens / self.rate, self._blocked_until - now, 0)
+
+    def acquire(self) -> None:
+        time.sleep(self._reserve())
+
+    async def acquire_async(self) -> None:
+        await asyncio.sleep(self._reserve())
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.rate = min(self._max_rate, self.rate + self._max_rate / 20)
+            self._backoff = self.MIN_BACKOFF
+
+    def on_error(self, retry_after: float | None = None, throttled: bool = False) -> None:
+        with self._lock:
+            self.rate = max(self._min_rate, self.rate / 2 if throttled else self.rate * 3 / 4)
+
+            delay = retry_after if retry_after is not None else self._backoff
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+            self._backoff = min(self.MAX_BACKOFF, self._backoff * 2)
+
+        RETRIES.inc(host=self.host, reason="throttled" if throttled else "failed")
+
+        logger.warning(f"{self.host} {'throttled' if throttled else 'failed'}, "
+                       f"waiting {delay:.1f}s, rate is {self.rate:.2f}/s")
+
+    @staticmethod
+    def _get_response(result) -> object | None:
+        return result if hasattr(result, "status_code") else getattr(result, "response", None)
+
+    @staticmethod
+    def _get_retry_after(response) -> float | None:
+        value = response.headers.get("Retry-After") if response is not None else None
+        if not value:
+            return None
+
+        if value.isdigit():
+            return float(value)
+
+        try:
+            return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0)
+        except (TypeError, ValueError):
+            return None
+
+    def _handle(self, result, last_attempt: bool, idempotent: bool = True) -> bool:
+        response = self._get_response(result)
+        status_code = getattr(response, "status_code", None)
+
+        # Results that are not responses, like parsed gspread values, only fail by raising
+        if status_code is None and not isinstance(result, Exception) or \
+                status_code is not None and status_code < 500 and status_code != 429:
+            self.on_success()
+            return False
+
+        self.on_error(self._get_retry_after(response), throttled=status_code == 429)
+
+        # A throttled request was not applied, any other failure may have been after the server applied it
+        return not last_attempt and (idempotent or status_code == 429)
+
+    def call(self, request: Callable[[], T], attempts: int | None = None, idempotent: bool = True) -> T:
+        attempts = attempts or self.ATTEMPTS
+        for attempt in range(attempts):
+            self.acquire()
+            try:
+                result = request()
+            except Exception as e:
+                if self._handle(e, attempt == attempts - 1, idempotent):
+                    continue
+                raise
+
+            if not self._handle(result, attempt == attempts - 1, idempotent):
+                return result
+
+    async def call_async(self, request: Callable[[], Awaitable[T]], attempts: int | None = None,
+                         idempotent: bool = True) -> T:
+        attempts = attempts or self.ATTEMPTS
+        for attempt in range(attempts):
+            await self.acquire_async()
+            try:
+                result = await request()
+            except Exception as e:
+                if self._handle(e, attempt == attempts - 1, idempotent):
+                    continue
+                raise
+
+            if not self._handle(result, attempt == attempts - 1, idempotent):
+                return result
+
+
+_RATES = {
+    "api.ozon.ru": (4, 20),
+    "card.wb.ru": (4, 20),
+    "sheets.googleapis.com": (0.5, 1),
+}
+_limiters: dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(host: str) -> RateLimiter:
+    with _limiters_lock:
+        if host not in _limiters:
+            rate, max_rate = _RATES.get(host, (1, 10))
+            _limiters[host] = RateLimiter(host, rate, max_rate)
+        return _limiters[host]
+
+
+def set_rate_limiter(host: str, limiter: RateLimiter) -> None:
+    with _limiters_lock:
+        _limiters[host] = limiter
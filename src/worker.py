@@ -0,0 +1,67 @@
+import os
+import socket
+from contextlib import closing
+from threading import Event, Thread
+from time import sleep
+
+from src.models import Marketplace
+from src.polling import PollingPolicy
+from src.storage import QueueLock, WorkQueue
+from src.utils import logger
+
+
+class Worker:
+    LEASE = int(os.getenv("WORKER_LEASE", 120))
+    IDLE_DELAY = 5
+
+    def __init__(self, marketplace: Marketplace, queue: WorkQueue | None = None, name: str | None = None) -> None:
+        self.marketplace = marketplace
+        self.queue = queue or WorkQueue(marketplace.name)
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        # The coordinator plans with the same policy, a due item must not come from the cache here either
+        self.marketplace.parser.set_max_cache_age(PollingPolicy.get_max_cache_age())
+        # Workers of a marketplace share its account, and with it state like the Ozon cart
+        self.marketplace.parser.set_shared_lock(QueueLock(self.queue, self.marketplace.name, self.name, self.LEASE))
+
+    def run(self) -> None:
+        logger.info(f"Worker {self.name} is waiting for {self.marketplace.name} shards...")
+        try:
+            while True:
+                if not self.work():
+                    sleep(self.IDLE_DELAY)
+        finally:
+            self.marketplace.parser.close()
+
+    def work(self) -> bool:
+        shard = self.queue.claim(self.name, self.LEASE)
+        if shard is None:
+            return False
+
+        run, position, urls = shard
+        logger.info(f"Parsing shard {position} with {len(urls)} items...")
+
+        # The lease is renewed while parsing goes on, so it only expires when the worker is gone
+        stop = Event()
+
+        def renew() -> None:
+            while not stop.wait(self.LEASE / 3):
+                if not self.queue.renew(run, position, self.name, self.LEASE):
+                    return
+
+        renewer = Thread(target=renew, daemon=True)
+        renewer.start()
+        try:
+            with closing(self.marketplace.parser.get_items(urls)) as items:
+                results = list(items)
+        except Exception as e:
+            logger.exception(e)
+            self.queue.release(run, position, self.name)
+            self.marketplace.parser.close()
+            return True
+        finally:
+            stop.set()
+            renewer.join()
+
+        if not self.queue.complete(run, position, self.name, results):
+            logger.warning(f"Lost the lease on shard {position}, its results are dropped")
+        return True
@@ -0,0 +1,77 @@
+import pytest
+from requests import HTTPError, Response
+from requests.exceptions import Timeout
+
+from src.sheets.batch_update import BatchUpdate
+from src.utils import RateLimiter, set_rate_limiter
+
+
+class FakeSpreadsheet:
+    def __init__(self, failures: list[Exception], applied_before_failure: bool) -> None:
+        self.failures = failures
+        self.applied_before_failure = applied_before_failure
+        self.sent = 0
+        self.applied = []
+
+    def batch_update(self, body: dict) -> dict:
+        self.sent += 1
+        if self.failures:
+            if self.applied_before_failure:
+                self.applied.append(body["requests"])
+            raise self.failures.pop(0)
+        self.applied.append(body["requests"])
+        return {"replies": [{} for _ in body["requests"]]}
+
+
+class FakeSheet:
+    id = 0
+
+    def __init__(self, spreadsheet: FakeSpreadsheet) -> None:
+        self.spreadsheet = spreadsheet
+
+
+def throttled() -> HTTPError:
+    response = Response()
+    response.status_code = 429
+    response.headers["Retry-After"] = "0"
+    return HTTPError(response=response)
+
+
+@pytest.fixture(autouse=True)
+def limiter(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(RateLimiter, "MIN_BACKOFF", 0)
+    set_rate_limiter("sheets.googleapis.com", RateLimiter("sheets.googleapis.com", 10 ** 6, 10 ** 6))
+
+
+def test_step_is_not_resent_after_a_timeout() -> None:
+    # The server applied the insert before the response timed out, sending it again would insert twice
+    spreadsheet = FakeSpreadsheet([Timeout()], applied_before_failure=True)
+    batch = BatchUpdate(FakeSheet(spreadsheet))
+    batch.insert_cols([["header"]], col=7)
+
+    with pytest.raises(Timeout):
+        batch.send(batch.get_chunks()[0][1], idempotent=False)
+
+    assert spreadsheet.sent == 1
+    assert len(spreadsheet.applied) == 1
+
+
+def test_step_is_resent_when_throttled() -> None:
+    spreadsheet = FakeSpreadsheet([throttled()], applied_before_failure=False)
+    batch = BatchUpdate(FakeSheet(spreadsheet))
+    batch.insert_cols([["header"]], col=7)
+
+    batch.send(batch.get_chunks()[0][1], idempotent=False)
+
+    assert spreadsheet.sent == 2
+    assert len(spreadsheet.applied) == 1
+
+
+def test_idempotent_update_is_resent_after_a_timeout() -> None:
+    spreadsheet = FakeSpreadsheet([Timeout()], applied_before_failure=True)
+    batch = BatchUpdate(FakeSheet(spreadsheet))
+    batch.update_cells([["1"]], row=2, col=7)
+
+    batch.execute()
+
+    assert spreadsheet.sent == 2
@@ -0,0 +1,21 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+HEAVY_MODULES = ("gspread", "curl_cffi", "oauth2client")
+
+
+def imported_modules(module: str) -> set[str]:
+    # A fresh interpreter, as this one may have imported anything by now
+    output = subprocess.run(
+        [sys.executable, "-c", f"import sys, {module}; print(' '.join(sys.modules))"],
+        cwd=Path(__file__).parents[1], capture_output=True, text=True, check=True,
+    ).stdout
+    return set(output.split())
+
+
+@pytest.mark.parametrize("module", ["src.models", "src.storage", "src.polling", "src.app", "src.config"])
+def test_import_does_not_load_clients(module: str) -> None:
+    assert imported_modules(module).isdisjoint(HEAVY_MODULES)